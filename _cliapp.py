@@ -1,3 +1,21 @@
-from factory import create_app
+'''the cli entrypoint, the app is only created for commands that need it
 
-app = create_app()
+    python _cliapp.py run
+    python _cliapp.py sla-scan --every 300
+'''
+from flask.cli import FlaskGroup
+
+from commands import register_commands
+
+
+def create_cli_app(info):
+    from factory import create_app
+    return create_app()
+
+
+cli = FlaskGroup(create_app=create_cli_app)
+register_commands(cli)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,206 @@
+import errno
+import fcntl
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+
+
+class SharedCache(object):
+    '''file backed result cache shared by every worker process on the box
+
+    entries are pickled into one file each under `path`, the file name
+    is derived from the current cache version so bumping the version
+    (see `invalidate`) makes every older entry unreachable at once;
+    memoized functions also get a version of their own, so a write
+    only drops the results it affects
+
+    scope and bypass work as for SingleFlight: scope is called for a
+    string added to every memoized key, e.g. so apps on different graph
+    namespaces sharing the directory never read each other's results
+    '''
+
+    VERSION_FILE = 'VERSION'
+    SUFFIX = '.cache'
+
+    def __init__(self, path=None, ttl=60, max_bytes=64 * 1024 * 1024, scope=None, bypass=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # called with (name, hit) on every memoized lookup
+        self.observers = []
+        self.scope = scope
+        # when it returns true, memoized functions are called uncached
+        self.bypass = bypass
+
+    def init_app(self, app):
+        app.config.setdefault('SHARED_CACHE_ENABLED', True)
+        app.config.setdefault('SHARED_CACHE_DIR', os.path.join(
+            tempfile.gettempdir(), 'flask-neo4j-demo-cache'))
+        app.config.setdefault('SHARED_CACHE_TTL', 60)
+        app.config.setdefault('SHARED_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+        if not app.config['SHARED_CACHE_ENABLED']:
+            self.path = None
+            return
+
+        self.path = app.config['SHARED_CACHE_DIR']
+        self.ttl = app.config['SHARED_CACHE_TTL']
+        self.max_bytes = app.config['SHARED_CACHE_MAX_BYTES']
+        self._ensure_dir()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def _ensure_dir(self):
+        try:
+            os.makedirs(self.path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _version_path(self, name=None):
+        if name is None:
+            return os.path.join(self.path, self.VERSION_FILE)
+        return os.path.join(self.path, '%s.%s' % (self.VERSION_FILE, name))
+
+    def version(self, name=None):
+        '''the current cache version, or that of a memoized name, shared through a file on disk'''
+        try:
+            with open(self._version_path(name)) as f:
+                return int(f.read().strip() or 0)
+        except (IOError, OSError, ValueError):
+            return 0
+
+    def _token(self, name=None):
+        '''the versions an entry is stored under'''
+        if name is None:
+            return '%d' % self.version()
+        return '%d.%d' % (self.version(), self.version(name))
+
+    def invalidate(self, *names):
+        '''bump the version of the memoized names, or of everything without names,
+        so that every worker misses on old entries'''
+        if not self.enabled:
+            return None
+        self._ensure_dir()
+        version = None
+        for name in names or (None,):
+            version = self._bump(self._version_path(name))
+        return version
+
+    def _bump(self, path):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            current = os.read(fd, 32).strip()
+            version = int(current or 0) + 1
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, str(version).encode('ascii'))
+        finally:
+            os.close(fd)
+        return version
+
+    def _entry_path(self, key, token):
+        digest = hashlib.sha1(('%s:%s' % (token, key)).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + self.SUFFIX)
+
+    def get(self, key, default=None, token=None):
+        if not self.enabled:
+            return default
+        entry = self._entry_path(key, self._token() if token is None else token)
+        try:
+            with open(entry, 'rb') as f:
+                expires_at, value = pickle.load(f)
+        except (IOError, OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return default
+        if expires_at < time.time():
+            self._remove(entry)
+            return default
+        # touch the entry so eviction drops the least recently used first
+        try:
+            os.utime(entry, None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value, ttl=None, token=None):
+        if not self.enabled:
+            return value
+        self._ensure_dir()
+        ttl = self.ttl if ttl is None else ttl
+        entry = self._entry_path(key, self._token() if token is None else token)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((time.time() + ttl, value), f, 2)
+            # rename is atomic so readers never see a partial entry
+            os.rename(tmp, entry)
+        except Exception:
+            self._remove(tmp)
+            raise
+        self._evict()
+        return value
+
+    def _remove(self, entry):
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(self.SUFFIX):
+                continue
+            entry = os.path.join(self.path, name)
+            try:
+                stat = os.stat(entry)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        return entries
+
+    def _evict(self):
+        '''drop the least recently used entries until under max_bytes'''
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(entry)
+            total -= size
+        return total
+
+    def clear(self):
+        if not self.enabled:
+            return None
+        for _, _, entry in self._entries():
+            self._remove(entry)
+
+    def memoize(self, name, ttl=None):
+        '''cache the return value of a function under name and its arguments'''
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or (self.bypass is not None and self.bypass()):
+                    return func(*args, **kwargs)
+                key = '%s:%r:%r' % (name, args, sorted(kwargs.items()))
+                if self.scope is not None:
+                    key = '%s:%s' % (self.scope(), key)
+                # read before calling func, so a result computed across an
+                # invalidate is stored under the old version and never served
+                token = self._token(name)
+                missing = object()
+                value = self.get(key, missing, token)
+                for observer in self.observers:
+                    observer(name, value is not missing)
+                if value is missing:
+                    value = self.set(key, func(*args, **kwargs), ttl, token)
+                return value
+            return wrapper
+        return decorator
@@ -0,0 +1,201 @@
+import os
+import time
+
+import click
+from flask.cli import with_appcontext
+
+import startup
+
+# the models, the graph driver and what they pull in are imported in the
+# command bodies, so the cli starts without them and only the command run
+# pays for its imports
+
+
+@click.command('snapshot-dump')
+@click.argument('path')
+@click.option('--batch-size', default=10000, help='nodes/relationships read per query')
+@with_appcontext
+def snapshot_dump(path, batch_size):
+    '''dump the whole graph to a binary snapshot file'''
+    from extensions import db
+    import snapshot
+    counts = snapshot.dump(db.graph, path, batch_size)
+    click.echo('dumped %(nodes)d nodes and %(relationships)d relationships' % counts)
+
+
+@click.command('snapshot-restore')
+@click.argument('path')
+@click.option('--batch-size', default=1000, help='nodes/relationships written per UNWIND')
+@click.option('--wipe', is_flag=True, help='delete the existing graph first')
+@with_appcontext
+def snapshot_restore(path, batch_size, wipe):
+    '''bulk load a snapshot file into the graph'''
+    from extensions import db, cache
+    from wipe import wipe_graph
+    import snapshot
+    if wipe:
+        wipe_graph(db.graph)
+    counts = snapshot.restore(db.graph, path, batch_size)
+    cache.invalidate()
+    click.echo('restored %(nodes)d nodes and %(relationships)d relationships' % counts)
+
+
+@click.command('wipe')
+@click.option('--batch-size', default=10000, help='relationships/nodes deleted per transaction')
+@with_appcontext
+def wipe(batch_size):
+    '''delete the whole graph in chunks, rerun to resume an interrupted wipe'''
+    from extensions import db, cache
+    from wipe import wipe_graph
+
+    def progress(stage, deleted):
+        click.echo('%s: %d deleted' % (stage, deleted))
+    deleted = wipe_graph(db.graph, batch_size, progress)
+    cache.invalidate()
+    click.echo('deleted %(relationships)d relationships and %(nodes)d nodes' % deleted)
+
+
+@click.command('process-deploy')
+@with_appcontext
+def process_deploy():
+    '''store process versions from the definitions file that are not in the graph yet'''
+    from extensions import db, cache, processes
+    from models import GenericProcess, BuildGenericProcess
+    _check_document_ids()
+    changed = []
+    for version in processes.versions():
+        checksum = processes.get(version).checksum
+        stored = GenericProcess.select(db.graph).where(version=version).first()
+        if stored is None:
+            BuildGenericProcess(version).init()
+            click.echo('stored process version %d' % version)
+        elif stored.checksum is None:
+            # stored before checksums were recorded
+            stored.checksum = checksum
+            db.graph.push(stored)
+            click.echo('process version %d already stored, recorded its checksum' % version)
+        elif stored.checksum != checksum:
+            changed.append(version)
+        else:
+            click.echo('process version %d already stored' % version)
+    cache.invalidate()
+    if changed:
+        raise click.ClickException(
+            'process versions %s differ from the stored ones, add a new version instead'
+            % ', '.join(str(_) for _ in changed))
+
+
+def _check_document_ids():
+    from models import GenericDocument, Onboard
+    out_of_range = GenericDocument.out_of_range_ids()
+    if out_of_range:
+        raise click.ClickException(
+            'stored document ids %s do not fit the onboard document masks (at most %d documents)'
+            % (', '.join(str(_) for _ in out_of_range), Onboard.MAX_DOCUMENTS))
+
+
+@click.command('migrate-documents')
+@click.option('--batch-size', default=1000, help='onboards migrated per transaction')
+@with_appcontext
+def migrate_documents(batch_size):
+    '''move onboards from MISSING_DOCUMENT relationships to document masks, rerun to resume'''
+    from models import GenericDocument
+    _check_document_ids()
+    migrated = GenericDocument.migrate_relationships(batch_size)
+    click.echo('migrated %d onboards' % migrated)
+
+
+@click.command('sla-scan')
+@click.option('--every', default=0, help='rescan every N seconds instead of once')
+@with_appcontext
+def sla_scan(every):
+    '''record overdue steps of onboards changed or due since the last scan'''
+    from extensions import db, processes
+    from sla import SlaScanner
+    scanner = SlaScanner(db.graph, processes)
+    scanner.ensure_indexes()
+    while True:
+        counts = scanner.run(int(time.time()))
+        click.echo('scanned %(scanned)d onboards, %(overdue)d overdue steps' % counts)
+        if not every:
+            return
+        time.sleep(every)
+
+
+@click.command('create-indexes')
+@with_appcontext
+def create_indexes():
+    '''index the properties the models look nodes up by, and constrain the singleton nodes'''
+    from extensions import db
+    for label, key in (('Client', 'company_id'), ('Employee', 'id'), ('Application', 'name'),
+                       ('ChangeEvent', 'offset'), ('Onboard', 'next_due'), ('Onboard', 'changed_at')):
+        db.graph.run("CREATE INDEX ON :%s(%s)" % (label, key))
+        click.echo('indexed :%s(%s)' % (label, key))
+    # the summary and the outbox sequence are merged by name under a lock,
+    # a constraint keeps concurrent first merges from creating two of them
+    for label, key in (('ComplianceSummary', 'name'), ('OutboxSequence', 'name')):
+        db.graph.run("CREATE CONSTRAINT ON (n:%s) ASSERT n.%s IS UNIQUE" % (label, key))
+        click.echo('constrained :%s(%s) unique' % (label, key))
+
+
+@click.command('compliance-rebuild')
+@with_appcontext
+def compliance_rebuild():
+    '''recompute the compliance summary from every client and onboard'''
+    from extensions import db, cache
+    from graphdb import transaction
+    import summary
+    with transaction(db.graph) as tx:
+        counts = summary.rebuild(tx)
+    cache.invalidate()
+    click.echo(('%(clients)d clients: %(complete)d complete, %(incomplete)d incomplete, '
+                '%(invalid)d invalid; %(changed)d rows corrected') % counts)
+
+
+@click.command('changes')
+@click.option('--after', default=0, help='print events after this offset')
+@click.option('--offset-file', type=click.Path(), help='resume from and record the last offset here')
+@click.option('--follow', is_flag=True, help='keep polling for new events')
+@click.option('--every', default=1.0, help='seconds between polls when following')
+@with_appcontext
+def changes(after, offset_file, follow, every):
+    '''print change events as json lines, in offset order'''
+    from extensions import db
+    import outbox
+    if offset_file and os.path.exists(offset_file):
+        with open(offset_file) as f:
+            after = int(f.read().strip() or after)
+    while True:
+        events = outbox.read(db.graph, after)
+        for line in outbox.iter_ndjson(events):
+            click.echo(line, nl=False)
+        if events:
+            after = events[-1]['offset']
+            if offset_file:
+                with open(offset_file, 'w') as f:
+                    f.write(str(after))
+            continue
+        if not follow:
+            return
+        time.sleep(every)
+
+
+@click.command('startup-profile')
+@click.option('--connect', is_flag=True, help='include the first graph query')
+def startup_profile(connect):
+    '''report where app startup time goes, measured in a fresh interpreter'''
+    click.echo(startup.report(startup.profile(connect)))
+
+
+def register_commands(cli):
+    '''add the commands to a click group, e.g. app.cli'''
+    cli.add_command(snapshot_dump)
+    cli.add_command(snapshot_restore)
+    cli.add_command(wipe)
+    cli.add_command(process_deploy)
+    cli.add_command(migrate_documents)
+    cli.add_command(sla_scan)
+    cli.add_command(create_indexes)
+    cli.add_command(changes)
+    cli.add_command(compliance_rebuild)
+    cli.add_command(startup_profile)
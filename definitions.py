@@ -0,0 +1,185 @@
+'''versioned onboarding process definitions
+
+definitions are read from a json file of the form
+
+    {"processes": [{
+        "version": 1,
+        "tasks": [{"task_name": "...", "duration": 3, "depends_on": [0]}, ...],
+        "documents": [{"type": "...", "for_step": 0}, ...]
+    }]}
+
+step numbers and document ids are positions in their lists; each
+version is validated as a DAG and compiled once into the masks the
+models need, so requests never work out the process from the graph.
+the checksum of a version's tasks and documents is stored with it, so
+a deployed version can't be edited in place
+'''
+import hashlib
+import json
+import os
+
+# task durations are in days
+DAY = 24 * 60 * 60
+
+# bits available in a neo4j integer property
+MAX_STEPS = 63
+MAX_DOCUMENTS = 63
+
+try:
+    basestring
+except NameError:
+    basestring = str
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'processes.json')
+
+
+def topological_order(tasks):
+    '''step numbers ordered so every step follows its dependencies
+
+    raises ValueError on unknown dependencies or a cycle
+    '''
+    dependents = dict((step_number, []) for step_number in range(len(tasks)))
+    waiting = {}
+    for step_number, task in enumerate(tasks):
+        depends = set(task.get('depends_on') or [])
+        for each_depend in depends:
+            if each_depend not in dependents:
+                raise ValueError('step %d depends on unknown step %r' % (step_number, each_depend))
+            dependents[each_depend].append(step_number)
+        waiting[step_number] = len(depends)
+
+    ready = [_ for _ in range(len(tasks)) if not waiting[_]]
+    order = []
+    while ready:
+        step_number = ready.pop(0)
+        order.append(step_number)
+        for dependent in dependents[step_number]:
+            waiting[dependent] -= 1
+            if not waiting[dependent]:
+                ready.append(dependent)
+
+    if len(order) != len(tasks):
+        cycle = sorted(_ for _ in waiting if waiting[_])
+        raise ValueError('steps %s form a dependency cycle' % cycle)
+    return order
+
+
+class CompiledProcess(object):
+    '''one process version, validated and reduced to bitmasks'''
+
+    def __init__(self, definition):
+        self.version = definition.get('version')
+        if not isinstance(self.version, int) or isinstance(self.version, bool):
+            raise ValueError('process version must be an integer, got %r' % (self.version,))
+        try:
+            self._compile(definition)
+        except ValueError as e:
+            raise ValueError('process version %d: %s' % (self.version, e))
+
+    def _compile(self, definition):
+        self.tasks = [dict(_) for _ in definition.get('tasks') or []]
+        if not self.tasks:
+            raise ValueError('a process needs at least one task')
+        if len(self.tasks) > MAX_STEPS:
+            raise ValueError('at most %d tasks are supported' % MAX_STEPS)
+        for step_number, task in enumerate(self.tasks):
+            if not task.get('task_name'):
+                raise ValueError('step %d has no task_name' % step_number)
+            duration = task.get('duration')
+            if not isinstance(duration, (int, float)) or isinstance(duration, bool) or duration < 0:
+                raise ValueError('step %d needs a duration in days, got %r' % (step_number, duration))
+
+        self.order = topological_order(self.tasks)
+
+        self.dependency_masks = [0] * len(self.tasks)
+        for step_number in self.order:
+            for each_depend in self.tasks[step_number].get('depends_on') or []:
+                # dependencies come first in the order, so their masks are complete
+                self.dependency_masks[step_number] |= (
+                    1 << each_depend | self.dependency_masks[each_depend])
+        self.step_mask = (1 << len(self.tasks)) - 1
+
+        self.documents = []
+        for document_id, document in enumerate(definition.get('documents') or []):
+            if document_id >= MAX_DOCUMENTS:
+                raise ValueError('at most %d documents are supported' % MAX_DOCUMENTS)
+            if document.get('for_step') not in range(len(self.tasks)):
+                raise ValueError('document %d is for unknown step %r' % (
+                    document_id, document.get('for_step')))
+            if not document.get('type') or not isinstance(document['type'], basestring):
+                raise ValueError('document %d has no type' % document_id)
+            self.documents.append({
+                'id': document_id,
+                'type': document['type'],
+                'for_step': document['for_step']})
+        self.required_documents = (1 << len(self.documents)) - 1
+
+        # same shape as GenericDocument.list_with_steps
+        self.documents_by_id = dict((_['id'], {
+            'document_id': _['id'],
+            'document_type': _['type'],
+            'step_number': _['for_step']}) for _ in self.documents)
+
+        self.checksum = hashlib.sha1(json.dumps({
+            'tasks': self.tasks,
+            'documents': [(_['type'], _['for_step']) for _ in self.documents],
+        }, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    def dependency_mask(self, step_number):
+        if 0 <= step_number < len(self.tasks):
+            return self.dependency_masks[step_number]
+        return 0
+
+
+class ProcessRegistry(object):
+    '''the compiled process versions, loaded once per app'''
+
+    def __init__(self, path=None):
+        self.path = path
+        self._compiled = {}
+
+    def init_app(self, app):
+        app.config.setdefault('PROCESS_DEFINITIONS', DEFAULT_PATH)
+        self.path = app.config['PROCESS_DEFINITIONS']
+        self.load(self.path)
+
+    def load(self, path):
+        with open(path) as f:
+            definitions = json.load(f).get('processes') or []
+        compiled = {}
+        for definition in definitions:
+            process = CompiledProcess(definition)
+            if process.version in compiled:
+                raise ValueError('process version %d is defined twice' % process.version)
+            compiled[process.version] = process
+        self._compiled = compiled
+        return self.versions()
+
+    def register(self, definition):
+        process = CompiledProcess(definition)
+        self._compiled[process.version] = process
+        return process
+
+    def versions(self):
+        return sorted(self._compiled)
+
+    @property
+    def latest(self):
+        if not self._compiled:
+            raise LookupError('no process definitions loaded')
+        return self._compiled[max(self._compiled)]
+
+    def get(self, version=None):
+        '''the compiled process for a version, the latest by default'''
+        if version is None:
+            return self.latest
+        try:
+            return self._compiled[version]
+        except KeyError:
+            raise LookupError('unknown process version %r' % (version,))
+
+    def find(self, version):
+        '''like get, but None for unpinned or unknown versions'''
+        if version is None:
+            return None
+        return self._compiled.get(version)
@@ -0,0 +1,79 @@
+'''critical path and expected completion times of onboards
+
+step durations are in days; the projections for a process version are
+computed for all of its onboards at once, as arrays of onboards x steps
+'''
+import numpy as np
+
+from definitions import DAY
+
+
+def _direct_depends(process):
+    return [sorted(set(task.get('depends_on') or [])) for task in process.tasks]
+
+
+def _durations(process):
+    return np.array([task.get('duration') or 0 for task in process.tasks], dtype=np.float64)
+
+
+def earliest_finish(process, remaining):
+    '''earliest finish of each step given the days each still needs
+
+    remaining is an (onboards, steps) array; steps run as soon as all
+    their dependencies are done, so a step finishes its own remaining
+    days after the latest of its dependencies
+    '''
+    depends = _direct_depends(process)
+    finish = np.zeros(remaining.shape, dtype=np.float64)
+    for step_number in process.order:
+        if depends[step_number]:
+            start = finish[:, depends[step_number]].max(axis=1)
+        else:
+            start = 0
+        finish[:, step_number] = start + remaining[:, step_number]
+    return finish
+
+
+def critical_path(process):
+    '''the longest chain of dependent steps and its length in days'''
+    depends = _direct_depends(process)
+    finish = earliest_finish(process, _durations(process)[np.newaxis, :])[0]
+    if not len(finish):
+        return {'steps': [], 'duration': 0}
+
+    step_number = int(finish.argmax())
+    path = [step_number]
+    while depends[step_number]:
+        step_number = max(depends[step_number], key=lambda _: finish[_])
+        path.append(step_number)
+    return {'steps': path[::-1], 'duration': float(finish.max())}
+
+
+def completed_matrix(process, completed_masks):
+    '''(onboards, steps) booleans from the onboards' completed_steps masks'''
+    masks = np.array([mask or 0 for mask in completed_masks], dtype=np.int64)
+    bits = np.arange(len(process.tasks), dtype=np.int64)
+    return (masks[:, np.newaxis] >> bits) & 1 == 1
+
+
+def remaining_days(process, completed_masks):
+    '''days until each onboard could complete, critical path of what is left'''
+    completed = completed_matrix(process, completed_masks)
+    remaining = np.where(completed, 0.0, _durations(process)[np.newaxis, :])
+    if not remaining.size:
+        return np.zeros(len(completed), dtype=np.float64)
+    return earliest_finish(process, remaining).max(axis=1)
+
+
+def expected_completions(process, completed_masks, now, started_at=None):
+    '''expected completion timestamp of each onboard
+
+    the remaining steps are counted from when each onboard last made
+    progress (started_at, e.g. its last completed step), so days already
+    spent on them count; an overdue onboard is expected no earlier than now
+    '''
+    remaining = remaining_days(process, completed_masks) * DAY
+    if started_at is None:
+        return now + remaining
+    started = np.array([now if _ is None else _ for _ in started_at], dtype=np.float64)
+    return np.maximum(now, started + remaining)
@@ -1,5 +1,24 @@
-from flask_py2neo import Py2Neo
 from flask_bootstrap import Bootstrap
 
-db = Py2Neo()
-bootstrap = Bootstrap()
\ No newline at end of file
+from graphdb import GraphDB
+from cache import SharedCache
+from singleflight import SingleFlight
+from jobs import JobRunner
+from definitions import ProcessRegistry
+from metrics import Metrics
+
+db = GraphDB()
+bootstrap = Bootstrap()
+# a request that wrote reads the primary, never results shared with other requests
+cache = SharedCache(scope=db.scope, bypass=db.wrote)
+flight = SingleFlight(db.scope, bypass=db.wrote)
+jobs = JobRunner()
+processes = ProcessRegistry()
+metrics = Metrics(db, cache)
+
+
+def after_fork():
+    '''reset per-process state in a worker forked from a preloaded app'''
+    db.reset_connections()
+    flight.after_fork()
+    jobs.after_fork()
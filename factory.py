@@ -1,18 +1,25 @@
 from flask import Flask
-from extensions import db, bootstrap
+from extensions import db, bootstrap, cache, jobs, processes, metrics
 from views import bp
+from commands import register_commands
 
 
 def create_app(config=None):
     app = Flask(__name__)
     app.config.update({
-      'PY2NEO_HOST': 'db'    
+      'PY2NEO_HOST': 'db',
+      'WIPE_BATCH_SIZE': 10000
     })
     app.config.update(config or {})
     
     db.init_app(app)
     bootstrap.init_app(app)
+    cache.init_app(app)
+    jobs.init_app(app)
+    processes.init_app(app)
+    metrics.init_app(app)
 
     app.register_blueprint(bp)
+    register_commands(app.cli)
 
     return app
@@ -0,0 +1,376 @@
+import itertools
+import re
+import sys
+import time
+import warnings
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context
+from flask_py2neo import Py2Neo
+
+
+# one token of interest, scanned left to right: a string literal or
+# quoted name (copied as is), an alias bound by AS in a WITH, UNWIND or
+# RETURN, or a node pattern: "(", optional variable, optional labels,
+# then "{" or ")"; function calls such as count(n) or id(n) are skipped
+# by the lookbehind
+_TOKEN = re.compile(
+    r"(?P<string>'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)"
+    r"|(?P<alias>\b[Aa][Ss]\s+(?P<alias_name>[A-Za-z_]\w*))"
+    r"|(?P<node>(?<![\w.$`])\((?P<space>\s*)(?P<variable>[A-Za-z_]\w*)?"
+    r"(?P<labels>(?:\s*:\s*(?:`[^`]+`|\w+))*)(?=\s*[{)]))"
+)
+
+# clauses that make a cypher statement a write
+_WRITE_CLAUSE = re.compile(r'\b(CREATE|MERGE|SET|DELETE|REMOVE)\b', re.IGNORECASE)
+
+
+def namespace_statement(statement, namespace):
+    '''add the namespace label to the node patterns of a cypher statement
+
+    anonymous nodes get the label everywhere, named nodes only where the
+    variable is first bound, so variables bound by an earlier pattern or
+    an AS alias are never relabelled in a MERGE or CREATE clause; string
+    literals are left untouched
+    '''
+    bound = set()
+    label = ':`%s`' % namespace
+
+    def rewrite(match):
+        if match.group('alias'):
+            bound.add(match.group('alias_name'))
+            return match.group(0)
+        if not match.group('node'):
+            return match.group(0)
+        variable = match.group('variable')
+        if variable:
+            if variable in bound:
+                return match.group(0)
+            bound.add(variable)
+        return '(%s%s%s%s' % (match.group('space'), variable or '', match.group('labels'), label)
+
+    return _TOKEN.sub(rewrite, statement)
+
+
+@contextmanager
+def transaction(graph):
+    '''a transaction committed on exit, rolled back on error
+
+    statements that read a node's properties and write them back start
+    with a `SET n._lock = true` write (removed again before they end):
+    it takes the node's write lock, held until commit, so concurrent
+    transactions on the node queue up instead of reading stale values
+    '''
+    tx = graph.begin()
+    try:
+        yield tx
+    except Exception:
+        tx.rollback()
+        raise
+    tx.commit()
+
+
+class NamespacedGraph(object):
+    '''scope a py2neo graph or transaction to a namespace label
+
+    statements get the namespace label on their node patterns and
+    objects pushed or created through it are labelled (and merged on
+    their primary key) within the namespace, everything else is
+    delegated to the wrapped graph
+    '''
+
+    def __init__(self, target, namespace):
+        self._target = target
+        self.namespace = namespace
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    @contextmanager
+    def _labelled(self, subgraph):
+        '''add the namespace label to a node, merging it within the namespace for the call'''
+        node = subgraph.__ogm__.node if hasattr(subgraph, '__ogm__') else subgraph
+        if not hasattr(node, 'add_label'):
+            yield subgraph
+            return
+        node.add_label(self.namespace)
+        if not getattr(node, '__primarykey__', None):
+            yield subgraph
+            return
+        # merge on the namespace label so keys don't collide across namespaces,
+        # then give the node back its own primary label
+        primary_label = node.__dict__.get('__primarylabel__')
+        node.__primarylabel__ = self.namespace
+        try:
+            yield subgraph
+        finally:
+            if primary_label is None:
+                del node.__primarylabel__
+            else:
+                node.__primarylabel__ = primary_label
+
+    def run(self, statement, parameters=None, **kwparameters):
+        return self._target.run(
+            namespace_statement(statement, self.namespace), parameters, **kwparameters)
+
+    def create(self, subgraph):
+        with self._labelled(subgraph):
+            return self._target.create(subgraph)
+
+    def merge(self, subgraph, *args, **kwargs):
+        with self._labelled(subgraph):
+            return self._target.merge(subgraph, *args, **kwargs)
+
+    def push(self, subgraph):
+        with self._labelled(subgraph):
+            return self._target.push(subgraph)
+
+    def begin(self, *args, **kwargs):
+        return NamespacedGraph(self._target.begin(*args, **kwargs), self.namespace)
+
+
+def _mark_written():
+    if has_app_context():
+        g.graph_written = True
+
+
+def _written():
+    return has_app_context() and getattr(g, 'graph_written', False)
+
+
+class PrimaryGraph(object):
+    '''note on the app context when anything is written to the primary
+
+    py2neo 3 has no causal bookmarks, so once a request has written,
+    its later reads stay on the primary instead of a replica that may
+    not have caught up yet
+    '''
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def run(self, statement, parameters=None, **kwparameters):
+        if _WRITE_CLAUSE.search(statement):
+            _mark_written()
+        return self._target.run(statement, parameters, **kwparameters)
+
+    def create(self, subgraph):
+        _mark_written()
+        return self._target.create(subgraph)
+
+    def merge(self, subgraph, *args, **kwargs):
+        _mark_written()
+        return self._target.merge(subgraph, *args, **kwargs)
+
+    def push(self, subgraph):
+        _mark_written()
+        return self._target.push(subgraph)
+
+    def delete(self, subgraph):
+        _mark_written()
+        return self._target.delete(subgraph)
+
+    def begin(self, *args, **kwargs):
+        _mark_written()
+        return self._target.begin(*args, **kwargs)
+
+
+class ReplicaGraph(object):
+    '''a read replica that hands its statements to the primary when the
+    replica can't be reached
+
+    errors the database itself reports (py2neo's GraphError, e.g. a bad
+    statement) are raised as usual; anything else, such as a refused
+    connection, is reported to on_failure and the statement is run on
+    the primary instead
+    '''
+
+    def __init__(self, target, primary, on_failure=None):
+        self._target = target
+        self._primary = primary
+        self._on_failure = on_failure
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def run(self, statement, parameters=None, **kwparameters):
+        from py2neo.database.status import GraphError
+        try:
+            return self._target.run(statement, parameters, **kwparameters)
+        except GraphError:
+            raise
+        except Exception:
+            if self._on_failure is not None:
+                self._on_failure()
+            return self._primary.run(statement, parameters, **kwparameters)
+
+
+class TimedGraph(object):
+    '''time every statement run through a py2neo graph
+
+    statements are named after the function that ran them, which keeps
+    the names few and readable without touching the model code
+    '''
+
+    def __init__(self, target, timer):
+        self._target = target
+        self._timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def run(self, statement, parameters=None, **kwparameters):
+        with self._timer(sys._getframe(1).f_code.co_name):
+            return self._target.run(statement, parameters, **kwparameters)
+
+    def begin(self, *args, **kwargs):
+        return TimedGraph(self._target.begin(*args, **kwargs), self._timer)
+
+
+class ScopedTransaction(object):
+    '''hand out an open transaction in place of a new one
+
+    model code calling graph.begin(), including py2neo's own autocommit
+    create/push, gets this view of the scope's transaction; commit only
+    flushes pending statements so nothing outlives the scope
+    '''
+
+    def __init__(self, tx):
+        self._tx = tx
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
+
+    def commit(self):
+        return self._tx.process()
+
+    def finish(self):
+        return self._tx.process()
+
+    def rollback(self):
+        return None
+
+
+class GraphDB(Py2Neo):
+    '''the py2neo extension with optional namespace isolation
+
+    set GRAPH_NAMESPACE to scope every model read and write to nodes
+    carrying that label, e.g. one namespace per parallel test worker;
+    set query_timer to a context manager factory taking a query name to
+    time every statement run through `graph`
+
+    set GRAPH_READ_REPLICAS to a list of hosts to serve `read_graph`
+    from them in turn; they share the primary's ports and credentials.
+    a replica that can't be reached is skipped for GRAPH_REPLICA_RETRY
+    seconds, its reads going to the others or the primary meanwhile
+    '''
+
+    query_timer = None
+
+    _replica_turn = itertools.count()
+    # host -> when a replica that couldn't be reached is tried again
+    _replica_down = {}
+
+    def init_app(self, app):
+        app.config.setdefault('GRAPH_NAMESPACE', None)
+        app.config.setdefault('GRAPH_READ_REPLICAS', [])
+        app.config.setdefault('GRAPH_REPLICA_RETRY', 30)
+        Py2Neo.init_app(self, app)
+
+    def reset_connections(self):
+        '''forget graphs and connections inherited from a parent process
+
+        py2neo caches one DBMS/Graph (and its connections) per address at
+        class level, so a forked worker must drop them and connect anew
+        rather than share the parent's sockets
+        '''
+        # the caches are private to py2neo 3.x (the version flask-py2neo
+        # 0.1-alpha installs); check them again when upgrading py2neo
+        from py2neo import database
+        for cls, cache in ((database.Graph, '_Graph__instances'),
+                           (database.DBMS, '_DBMS__instances')):
+            instances = getattr(cls, cache, None)
+            if not hasattr(instances, 'clear'):
+                warnings.warn('py2neo %s.%s not found, a forked worker may share its '
+                              "parent's graph connections" % (cls.__name__, cache))
+                continue
+            instances.clear()
+
+    @property
+    def namespace(self):
+        return current_app.config.get('GRAPH_NAMESPACE')
+
+    def wrote(self):
+        '''whether this request wrote to the primary, so its reads must not
+        be served from results shared with other requests'''
+        return _written()
+
+    def scope(self):
+        '''which graph reads in this context go to, for keying shared results'''
+        if not has_app_context():
+            return ''
+        return self.namespace or ''
+
+    @contextmanager
+    def rollback_scope(self):
+        '''route every read and write through one transaction, rolled back on exit
+
+        py2neo caches one Graph per address and the OGM loads related
+        objects through that same instance, so run/begin are overridden
+        on it for the duration of the scope; meant for test isolation
+        '''
+        graph = Py2Neo.graph.fget(self)
+        tx = graph.begin()
+        scoped = ScopedTransaction(tx)
+        graph.run = tx.run
+        graph.begin = lambda *args, **kwargs: scoped
+        try:
+            yield tx
+        finally:
+            del graph.run
+            del graph.begin
+            tx.rollback()
+
+    def _wrap(self, graph, primary=True):
+        namespace = self.namespace
+        if namespace:
+            graph = NamespacedGraph(graph, namespace)
+        if primary and current_app.config.get('GRAPH_READ_REPLICAS'):
+            graph = PrimaryGraph(graph)
+        if self.query_timer is not None:
+            graph = TimedGraph(graph, self.query_timer)
+        return graph
+
+    @property
+    def graph(self):
+        '''the primary, for writes and for reads that must see them'''
+        return self._wrap(Py2Neo.graph.fget(self))
+
+    def _replica(self, host):
+        from py2neo import Graph
+        settings = dict((key[len('PY2NEO_'):].lower(), value)
+                        for key, value in current_app.config.items()
+                        if key.startswith('PY2NEO_') and value is not None
+                        and key != 'PY2NEO_HOST')
+        # py2neo keeps one Graph per address, so this only connects once
+        return Graph(host=host, **settings)
+
+    def _mark_down(self, host):
+        def mark_down():
+            self._replica_down[host] = time.time() + current_app.config['GRAPH_REPLICA_RETRY']
+        return mark_down
+
+    @property
+    def read_graph(self):
+        '''a read replica, or the primary when there are none up or this request wrote'''
+        now = time.time()
+        replicas = [_ for _ in current_app.config.get('GRAPH_READ_REPLICAS') or []
+                    if self._replica_down.get(_, 0) <= now]
+        if not replicas or _written():
+            return self.graph
+        host = replicas[next(self._replica_turn) % len(replicas)]
+        replica = ReplicaGraph(self._replica(host), Py2Neo.graph.fget(self), self._mark_down(host))
+        return self._wrap(replica, primary=False)
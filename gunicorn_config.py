@@ -0,0 +1,42 @@
+'''gunicorn settings for serving in production
+
+    gunicorn -c gunicorn_config.py wsgi:app
+
+the app is loaded once in the master and forked into the workers, each
+worker then opens its own graph connections
+'''
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+preload_app = True
+
+# the views mostly wait on neo4j, so a few threads per worker
+# keep the cores busy without a worker per connection
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# recycling a worker kills the job threads it runs (see jobs.py), so
+# workers are only recycled, jittered so they don't all restart
+# together, when GUNICORN_MAX_REQUESTS is set and jobs run elsewhere
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+
+def post_fork(server, worker):
+    from extensions import after_fork
+    after_fork()
+
+
+def child_exit(server, worker):
+    # drop the live gauges of a dead worker from the shared metrics
+    from metrics import multiprocess_dir
+    if multiprocess_dir():
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
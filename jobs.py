@@ -0,0 +1,246 @@
+import errno
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+INTERRUPTED = 'interrupted'
+
+
+class JobConflict(RuntimeError):
+    '''another job of the same exclusive group is queued or running'''
+
+    def __init__(self, job):
+        RuntimeError.__init__(self, 'job %s (%s) is already %s' % (job['id'], job['name'], job['status']))
+        self.job = job
+
+
+class JobRunner(object):
+    '''run long jobs on a local pool of worker threads
+
+    each job's state is kept as a json file under `path`, so any web
+    worker on the box can report on it. the process that owns a queued
+    or running job renews its lease every few seconds; a job whose lease
+    ran out was cut short and is marked interrupted instead of being
+    lost track of (pids are reused, so they can't tell)
+    '''
+
+    def __init__(self, path=None, workers=2, lease=30):
+        self.path = path
+        self.workers = workers
+        self.lease = lease
+        self.app = None
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._owned = {}
+        self._heartbeat = None
+        self._recovered = False
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_DIR', os.path.join(
+            tempfile.gettempdir(), 'flask-neo4j-demo-jobs'))
+        app.config.setdefault('JOBS_WORKERS', 2)
+        app.config.setdefault('JOBS_LEASE', 30)
+
+        self.app = app
+        self.path = app.config['JOBS_DIR']
+        self.workers = app.config['JOBS_WORKERS']
+        self.lease = app.config['JOBS_LEASE']
+        # the job directory is only read once jobs are first used, not at boot
+        self._recovered = False
+
+    def after_fork(self):
+        '''start from an empty queue and no threads in a forked worker'''
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._owned = {}
+        self._heartbeat = None
+
+    def _ensure_dir(self):
+        try:
+            os.makedirs(self.path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _job_path(self, job_id):
+        return os.path.join(self.path, '%s.json' % job_id)
+
+    def _save(self, job):
+        with self._save_lock:
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(job, f)
+            os.rename(tmp, self._job_path(job['id']))
+        return job
+
+    def _ensure_recovered(self):
+        if not self._recovered:
+            self._ensure_dir()
+            self.recover()
+
+    def get(self, job_id):
+        self._ensure_recovered()
+        try:
+            with open(self._job_path(job_id)) as f:
+                job = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if self._expired(job):
+            job['status'] = INTERRUPTED
+            self._save(job)
+        return job
+
+    def all(self):
+        self._ensure_recovered()
+        jobs = []
+        for name in os.listdir(self.path):
+            if name.endswith('.json'):
+                job = self.get(name[:-len('.json')])
+                if job is not None:
+                    jobs.append(job)
+        return sorted(jobs, key=lambda job: job['created_at'])
+
+    def _expired(self, job):
+        '''a queued or running job whose owner stopped renewing its lease'''
+        if job['status'] not in (QUEUED, RUNNING) or job['id'] in self._owned:
+            return False
+        renewed_at = job.get('heartbeat_at') or job.get('created_at') or 0
+        return time.time() - renewed_at > self.lease
+
+    def recover(self):
+        '''mark jobs left queued or running by a dead process as interrupted'''
+        self._recovered = True
+        interrupted = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'):
+                continue
+            job_id = name[:-len('.json')]
+            try:
+                with open(self._job_path(job_id)) as f:
+                    job = json.load(f)
+            except (IOError, OSError, ValueError):
+                continue
+            if self._expired(job):
+                job['status'] = INTERRUPTED
+                self._save(job)
+                interrupted.append(job_id)
+        return interrupted
+
+    def _renew(self):
+        while True:
+            time.sleep(max(self.lease / 3.0, 0.1))
+            for job in list(self._owned.values()):
+                job['heartbeat_at'] = time.time()
+                self._save(job)
+
+    def _start_workers(self):
+        # started lazily so no threads exist before a preforking server forks
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(self.workers - len(self._threads)):
+                thread = threading.Thread(target=self._work, name='job-worker-%d' % i)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._renew, name='job-heartbeat')
+                self._heartbeat.daemon = True
+                self._heartbeat.start()
+
+    def _new_job(self, name, group=None):
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'name': name,
+            'group': group,
+            'status': QUEUED,
+            'pid': os.getpid(),
+            'progress': None,
+            'created_at': now,
+            'heartbeat_at': now,
+            'started_at': None,
+            'finished_at': None,
+            'duration': None,
+            'result': None,
+            'error': None,
+        }
+        self._owned[job['id']] = job
+        return self._save(job)
+
+    def submit(self, name, func, *args, **kwargs):
+        '''queue func to run in the background, it receives a progress callback'''
+        self._ensure_recovered()
+        job = self._new_job(name)
+        self._start_workers()
+        self._queue.put((job, func, args, kwargs))
+        return job['id']
+
+    def submit_exclusive(self, group, name, func, *args, **kwargs):
+        '''like submit, but raise JobConflict while a job of the group is
+        queued or running in any worker on the box'''
+        self._ensure_recovered()
+        fd = os.open(os.path.join(self.path, '%s.lock' % group), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            for each_job in self.all():
+                if each_job.get('group') == group and each_job['status'] in (QUEUED, RUNNING):
+                    raise JobConflict(each_job)
+            job = self._new_job(name, group)
+        finally:
+            os.close(fd)
+        self._start_workers()
+        self._queue.put((job, func, args, kwargs))
+        return job['id']
+
+    def _progress(self, job):
+        def progress(message):
+            job['progress'] = message
+            self._save(job)
+        return progress
+
+    def _work(self):
+        while True:
+            job, func, args, kwargs = self._queue.get()
+            try:
+                self._run(job, func, args, kwargs)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job, func, args, kwargs):
+        job['status'] = RUNNING
+        job['started_at'] = time.time()
+        self._save(job)
+        try:
+            with self.app.app_context():
+                job['result'] = func(*args, progress=self._progress(job), **kwargs)
+            job['status'] = FINISHED
+        except Exception as e:
+            self.app.logger.exception('job %s (%s) failed', job['id'], job['name'])
+            job['status'] = FAILED
+            job['error'] = '%s: %s' % (type(e).__name__, e)
+        job['finished_at'] = time.time()
+        job['duration'] = job['finished_at'] - job['started_at']
+        self._owned.pop(job['id'], None)
+        return self._save(job)
+
+    def join(self):
+        '''block until every queued job has run'''
+        self._queue.join()
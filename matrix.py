@@ -0,0 +1,73 @@
+'''employee x application access as a sparse matrix
+
+rows are employees and columns applications, both sorted; the granted
+cells are kept CSR style: the columns of row i are
+indices[indptr[i]:indptr[i + 1]]
+'''
+import csv
+import json
+
+try:
+    from StringIO import StringIO
+
+    def _cell(value):
+        # the py2 csv module only writes byte strings
+        return value.encode('utf-8') if isinstance(value, unicode) else value
+except ImportError:
+    from io import StringIO
+
+    def _cell(value):
+        return value
+
+
+def build(rows):
+    '''the matrix from (employee_id, application names) rows'''
+    rows = sorted((employee_id, sorted(set(_ for _ in names if _ is not None)))
+                  for employee_id, names in rows)
+    applications = sorted(set(name for _, names in rows for name in names))
+    column = dict((name, index) for index, name in enumerate(applications))
+
+    indptr = [0]
+    indices = []
+    for _, names in rows:
+        indices.extend(column[name] for name in names)
+        indptr.append(len(indices))
+
+    return {
+        'employees': [employee_id for employee_id, _ in rows],
+        'applications': applications,
+        'indptr': indptr,
+        'indices': indices,
+    }
+
+
+def columns(matrix, row):
+    return matrix['indices'][matrix['indptr'][row]:matrix['indptr'][row + 1]]
+
+
+def iter_json(matrix):
+    '''the matrix as a json document, one employee row per chunk'''
+    yield '{"applications": %s, "employees": [' % json.dumps(matrix['applications'])
+    for row, employee_id in enumerate(matrix['employees']):
+        yield '%s{"id": %s, "applications": %s}' % (
+            ', ' if row else '', json.dumps(employee_id), json.dumps(columns(matrix, row)))
+    yield ']}\n'
+
+
+def iter_csv(matrix):
+    '''the granted cells as employee_id,application csv lines'''
+    buf = StringIO()
+    writer = csv.writer(buf)
+
+    def line(*values):
+        writer.writerow([_cell(_) for _ in values])
+        value = buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+        return value
+
+    yield line('employee_id', 'application')
+    applications = matrix['applications']
+    for row, employee_id in enumerate(matrix['employees']):
+        for column in columns(matrix, row):
+            yield line(employee_id, applications[column])
@@ -0,0 +1,89 @@
+'''prometheus metrics served at /metrics
+
+request counts and latencies per route, cypher latencies per query
+name (the model function that ran the statement), statements in flight
+and result cache lookups. under gunicorn, point PROMETHEUS_MULTIPROC_DIR
+at a directory shared by the workers (emptied before each start) and
+/metrics reports the sum over all of them. each worker writes its own
+files, named by the pid prometheus_client looks up per process, so
+workers forked from the preloaded master don't share the master's
+'''
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest, multiprocess)
+
+REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests by route', ['endpoint', 'method', 'status'])
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route', ['endpoint', 'method'])
+QUERY_LATENCY = Histogram(
+    'cypher_query_duration_seconds', 'Cypher statement latency by query name', ['query'])
+QUERIES_IN_FLIGHT = Gauge(
+    'cypher_queries_in_flight', 'Cypher statements waiting on the graph connections',
+    multiprocess_mode='livesum')
+CACHE_LOOKUPS = Counter(
+    'cache_lookups_total', 'Shared result cache lookups by cached function', ['name', 'result'])
+
+
+def multiprocess_dir():
+    # the names prometheus_client reads, the lowercase one is deprecated
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir')
+
+
+@contextmanager
+def time_query(name):
+    QUERIES_IN_FLIGHT.inc()
+    start = time.time()
+    try:
+        yield
+    finally:
+        QUERY_LATENCY.labels(name).observe(time.time() - start)
+        QUERIES_IN_FLIGHT.dec()
+
+
+def count_cache_lookup(name, hit):
+    CACHE_LOOKUPS.labels(name, 'hit' if hit else 'miss').inc()
+
+
+class Metrics(object):
+    '''instrument requests, graph queries and the shared cache of an app'''
+
+    def __init__(self, db=None, cache=None):
+        self.db = db
+        self.cache = cache
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        app.before_request(self._start_request)
+        app.after_request(self._end_request)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+
+        if self.db is not None:
+            self.db.query_timer = time_query
+        if self.cache is not None:
+            self.cache.observers.append(count_cache_lookup)
+
+    def _start_request(self):
+        g.metrics_start = time.time()
+
+    def _end_request(self, response):
+        start = getattr(g, 'metrics_start', None)
+        endpoint = request.endpoint or 'unmatched'
+        if start is not None and endpoint != 'metrics':
+            REQUEST_LATENCY.labels(endpoint, request.method).observe(time.time() - start)
+            REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+        return response
+
+    def export(self):
+        registry = REGISTRY
+        if multiprocess_dir():
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
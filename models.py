@@ -1,6 +1,16 @@
 import arrow
 
-from extensions import db
+import matrix
+import outbox
+import summary
+from extensions import db, cache, flight, processes
+from graphdb import transaction
+from projection import record_type, project, project_columns
+
+
+ComplianceStatus = record_type('ComplianceStatus', summary.FIELDS)
+DocumentStatus = record_type('DocumentStatus', (
+    'company_id', 'company_name', 'document_type', 'step_number'))
 
 
 class Client(db.Model):
@@ -20,39 +30,69 @@ class Client(db.Model):
         client.person = True
         client.company_id = company_id
         client.company_name = company_name
-        db.graph.create(client)
+        with transaction(db.graph) as tx:
+            tx.create(client)
+            outbox.append(tx, [outbox.event('client_created', company_id, company_name=company_name)])
+        cache.invalidate('compliance_summary')
         return client
 
     @staticmethod
     def list_all():
-        '''list all clients'''
-        return [_ for _ in Client.select(db.graph)]
+        '''list all clients, as records of their properties'''
+        return Client.project()
+
+    @staticmethod
+    def project(fields=('company_id', 'company_name'), order_by='company_name'):
+        '''list just the given client properties as records'''
+        return project(db.graph, 'Client', fields, order_by)
 
     @staticmethod
     def list_all_with_compliance_status():
-        '''get a list of all clients with compliance status'''
-        cursor = db.graph.run((
-            "match (c:Client)-[:HAS_ONBOARD]->(o) "
-            "return c, o.completed AS completed, o.valid_onboard AS v "
-            "order by c.company_name"
-        ))
-        return [{
-            'client': result['c'],
-            'completed': result['completed'], 
-            'valid_onboard': result['v']} for result in cursor]
+        '''get a list of all clients with compliance status, from the compliance summary'''
+        return [ComplianceStatus(*_) for _ in Client.compliance_summary()['rows']]
+
+    @staticmethod
+    @cache.memoize('compliance_summary')
+    @flight.coalesce('compliance_summary')
+    def compliance_summary():
+        '''the materialized compliance rows and counts, see summary.py'''
+        compliance = summary.read(db.read_graph)
+        if compliance is None:
+            # graphs from before the summary get it built on first read
+            with transaction(db.graph) as tx:
+                summary.rebuild(tx)
+            compliance = summary.read(db.graph)
+        return compliance
 
     @staticmethod
+    @flight.coalesce('document_status')
     def list_all_with_document_status():
         '''get a list of all clients with document status'''
-        cursor = db.graph.run((
-            "match (c:Client)-[:HAS_ONBOARD]->()-[:MISSING_DOCUMENT]->(d)-[:FOR_STEP]->(s) "
-            "return c, d, s "
-            "order by c.company_name, s.step_number"
+        unpinned = None
+        cursor = db.read_graph.run((
+            "match (c:Client)-[:HAS_ONBOARD]->(o) "
+            "return c.company_id AS company_id, c.company_name AS company_name, "
+            "o.required_documents AS required, o.submitted_documents AS submitted, "
+            "o.process_version AS version "
+            "order by c.company_name"
         ))
-        return [{
-            'client': result['c'],
-            'document_type': result['d']['document_type'],
-            'step_number': result['s']['step_number']} for result in cursor]
+        results = []
+        for result in cursor:
+            process = processes.find(result['version'])
+            if process is not None:
+                documents = process.documents_by_id
+            else:
+                # onboards built before process versions read the stored documents
+                if unpinned is None:
+                    unpinned = GenericDocument.list_with_steps()
+                documents = unpinned
+            missing = [documents[_] for _ in Onboard.missing_document_ids(
+                result['required'], result['submitted']) if _ in documents]
+            for document in sorted(missing, key=lambda _: (_['step_number'], _['document_id'])):
+                results.append(DocumentStatus(
+                    result['company_id'], result['company_name'],
+                    document['document_type'], document['step_number']))
+        return results
 
 
 class Onboard(db.Model):
@@ -61,14 +101,28 @@ class Onboard(db.Model):
     valid_onboard = db.Property()
     time_created = db.Property()
     time_completed = db.Property()
+    # document state as bitmasks indexed by document_id
+    required_documents = db.Property()
+    submitted_documents = db.Property()
+    # step state as bitmasks indexed by step_number
+    completed_steps = db.Property()
+    invalid_steps = db.Property()
+    # the GenericProcess version the onboard follows
+    process_version = db.Property()
+    # timestamps for the sla scanner, see sla.py
+    changed_at = db.Property()
+    last_step_at = db.Property()
+    next_due = db.Property()
 
     has_completed = db.RelatedTo('GenericStep')
     invalid = db.RelatedTo('GenericStep')
     must_follow = db.RelatedTo('GenericProcess')
-    missing_document = db.RelatedTo('GenericDocument')
-    submitted_document = db.RelatedTo('GenericDocument')
     has_activity = db.RelatedTo('Activity')
 
+    # bits available in a neo4j integer property
+    MAX_DOCUMENTS = 63
+    MAX_STEPS = 63
+
     @staticmethod
     def create():
         onboard = Onboard()
@@ -79,19 +133,142 @@ class Onboard(db.Model):
         a = arrow.utcnow()
         onboard.time_created = a.timestamp
         onboard.time_completed = None
+        onboard.changed_at = a.timestamp
 
         db.graph.create(onboard)
+        cache.invalidate('average_ttc')
         return onboard
 
     @staticmethod
+    @cache.memoize('average_ttc')
+    @flight.coalesce('average_ttc')
     def compute_average():
         '''calculate the average time to completion'''
-        ttc = [_.time_completed - _.time_created for _ in Onboard.select(db.graph) if _.time_completed]
-        if ttc:
-            ave_ttc = int(round(float(sum(ttc)) / len(ttc)))
-            return ave_ttc
+        # lazily, as in projection.columns
+        import numpy as np
+
+        onboards = Onboard.project_columns(('time_created', 'time_completed'), db.read_graph)
+        completed = onboards['time_completed']
+        # a missing or zero time_completed means not completed
+        ttc = (completed - onboards['time_created'])[~np.isnan(completed) & (completed != 0)]
+        if ttc.size:
+            return int(round(ttc.mean()))
         return None
 
+    # numeric onboard properties, returned as numpy float arrays by project_columns
+    NUMERIC = ('time_created', 'time_completed', 'process_version',
+               'changed_at', 'last_step_at', 'next_due')
+    # the bitmasks, returned as int64 arrays so no bit is lost
+    INTEGER = ('required_documents', 'submitted_documents', 'completed_steps', 'invalid_steps')
+
+    @staticmethod
+    def project_columns(fields, graph=None):
+        '''the given properties of every onboard as columns'''
+        if graph is None:
+            graph = db.graph
+        return project_columns(graph, 'Onboard', fields, Onboard.NUMERIC, integer=Onboard.INTEGER)
+
+    @staticmethod
+    def projected_completions():
+        '''expected completion of every active onboard, with the critical path
+        of each process version
+
+        onboards not pinned to a version are projected on the latest one
+        '''
+        # lazily, eta imports numpy
+        import eta
+
+        cursor = db.graph.run((
+            "match (c:Client)-[:HAS_ONBOARD]->(o) "
+            "where not coalesce(o.completed, false) "
+            "return c.company_id AS company_id, c.company_name AS company_name, "
+            "o.process_version AS version, o.completed_steps AS completed_steps, "
+            "coalesce(o.last_step_at, o.time_created) AS last_progress_at "
+            "order by c.company_name"
+        ))
+        by_version = {}
+        for result in cursor:
+            process = processes.find(result['version']) or processes.latest
+            by_version.setdefault(process.version, []).append(dict(result))
+
+        now = arrow.utcnow().timestamp
+        results = {'critical_paths': {}, 'onboards': []}
+        for version, onboards in sorted(by_version.items()):
+            process = processes.get(version)
+            path = eta.critical_path(process)
+            results['critical_paths'][version] = path
+            expected = eta.expected_completions(
+                process, [_['completed_steps'] for _ in onboards], now,
+                [_['last_progress_at'] for _ in onboards])
+            for onboard, expected_at in zip(onboards, expected):
+                onboard['version'] = version
+                onboard['expected_completion'] = int(round(expected_at))
+                results['onboards'].append(onboard)
+        results['onboards'].sort(key=lambda _: _['expected_completion'])
+        return results
+
+    @staticmethod
+    def document_bit(document_id):
+        if not 0 <= document_id < Onboard.MAX_DOCUMENTS:
+            raise ValueError('document_id must be between 0 and %d' % (Onboard.MAX_DOCUMENTS - 1))
+        return 1 << document_id
+
+    @staticmethod
+    def missing_document_ids(required, submitted):
+        '''document ids required but not submitted, from the onboard bitmasks'''
+        missing = (required or 0) & ~(submitted or 0)
+        return [_ for _ in range(Onboard.MAX_DOCUMENTS) if missing >> _ & 1]
+
+    @staticmethod
+    def step_bit(step_number):
+        if not 0 <= step_number < Onboard.MAX_STEPS:
+            raise ValueError('step_number must be between 0 and %d' % (Onboard.MAX_STEPS - 1))
+        return 1 << step_number
+
+    @staticmethod
+    def record_step(company_id, step_number, invalid=False):
+        '''set the step's completed (and optionally invalid) bit in one write
+
+        returns the new (completed_steps, invalid_steps) masks
+        '''
+        # _lock the onboard before reading its masks, see graphdb.transaction
+        with transaction(db.graph) as tx:
+            cursor = tx.run((
+                "match (:Client {company_id: $company_id})-[:HAS_ONBOARD]->(o) "
+                "set o._lock = true "
+                "with o, coalesce(o.completed_steps, 0) AS completed, coalesce(o.invalid_steps, 0) AS invalid "
+                "set o.completed_steps = CASE WHEN (completed / $bit) % 2 = 1 "
+                "  THEN completed ELSE completed + $bit END, "
+                "  o.invalid_steps = CASE WHEN NOT $invalid OR (invalid / $bit) % 2 = 1 "
+                "  THEN invalid ELSE invalid + $bit END, "
+                "  o.last_step_at = CASE WHEN (completed / $bit) % 2 = 1 "
+                "  THEN o.last_step_at ELSE $now END, "
+                "  o.changed_at = $now "
+                "remove o._lock "
+                "return o.completed_steps AS completed, o.invalid_steps AS invalid"
+            ), {'company_id': company_id, 'bit': Onboard.step_bit(step_number), 'invalid': invalid,
+                'now': arrow.utcnow().timestamp})
+            tx.process()
+            if not cursor.forward():
+                raise LookupError('required graph structure missing')
+            completed, invalid_steps = cursor.current()['completed'], cursor.current()['invalid']
+            outbox.append(tx, [outbox.event(
+                'step_completed', company_id, step_number=step_number, invalid=invalid,
+                completed_steps=completed, invalid_steps=invalid_steps)])
+        return completed, invalid_steps
+
+    @staticmethod
+    def get_missing_documents(company_id):
+        '''missing document ids for a client, read off its onboard'''
+        cursor = db.graph.run((
+            "match (:Client {company_id: $company_id})-[:HAS_ONBOARD]->(o) "
+            "return o.required_documents AS required, o.submitted_documents AS submitted"
+        ), {'company_id': company_id})
+        if not cursor.forward():
+            raise LookupError('required graph structure missing')
+        return Onboard.missing_document_ids(
+            cursor.current()['required'], cursor.current()['submitted'])
+
 
 class BuildClientOnboard(object):
     '''build the structure/relationships around the client node'''
@@ -101,7 +278,12 @@ class BuildClientOnboard(object):
 
     def init_rels(self):
         self.client.has_onboard.add(self.onboard)
-        db.graph.push(self.client)
+        with transaction(db.graph) as tx:
+            tx.push(self.client)
+            outbox.append(tx, [outbox.event(
+                'onboard_created', self.client.company_id, time_created=self.onboard.time_created)])
+            summary.update(tx, [self.client.company_id])
+        cache.invalidate('compliance_summary', 'average_ttc')
         return 'initial client steps structure built'
 
     def init(self):
@@ -111,6 +293,12 @@ class BuildClientOnboard(object):
 
 class GenericProcess(db.Model):
 
+    version = db.Property()
+    # bitmask of the step numbers in the process
+    step_mask = db.Property()
+    # checksum of the definition the version was stored from
+    checksum = db.Property()
+
     has_step = db.RelatedTo('GenericStep')
     first_step = db.RelatedTo('GenericStep')
     last_step = db.RelatedTo('GenericStep')
@@ -118,17 +306,33 @@ class GenericProcess(db.Model):
     requires_document = db.RelatedTo('GenericDocument')
 
     @staticmethod
-    def create():
+    def create(version=None, checksum=None):
         generic = GenericProcess()
+        generic.version = version
+        generic.checksum = checksum
         db.graph.create(generic)
         return generic
 
     @staticmethod
-    def get_steps():
-        return db.graph.run((
-          "MATCH (:GenericProcess)-[:NEXT*]->(s) "
+    def latest_version():
+        return db.graph.run("MATCH (p:GenericProcess) RETURN max(p.version)").evaluate()
+
+    @staticmethod
+    def get(version=None):
+        '''the stored process of a version, by default the latest stored'''
+        if version is None:
+            version = GenericProcess.latest_version()
+        if version is None:
+            return GenericProcess.select(db.graph).first()
+        return GenericProcess.select(db.graph).where(version=version).first()
+
+    @staticmethod
+    def get_steps(version=None):
+        return db.read_graph.run((
+          "MATCH (p:GenericProcess)-[:NEXT*]->(s) "
+          "WHERE $version IS NULL OR p.version = $version "
           "RETURN s ORDER BY s.step_number"
-        ))
+        ), {'version': version})
 
 
 class GenericStep(db.Model):
@@ -136,107 +340,151 @@ class GenericStep(db.Model):
     task_name = db.Property()
     step_number = db.Property()
     duration = db.Property()
+    version = db.Property()
+    # bitmask of every step this one depends on, directly or not
+    dependency_mask = db.Property()
 
     next = db.RelatedTo('GenericStep')
     depends_on = db.RelatedTo('GenericStep')
     needs_document = db.RelatedTo('GenericDocument')
 
     @staticmethod
-    def create(task_name, step_number, step_duration):
+    def create(task_name, step_number, step_duration, version=None):
         step = GenericStep()
         step.task_name = task_name
         step.step_number = step_number
         step.duration = step_duration
+        step.version = version
         db.graph.create(step)
         return step
 
     @staticmethod
     def all():
-        return [_ for _ in GenericStep.select(db.graph)]
+        return GenericStep.project()
 
     @staticmethod
-    def get_by_step_number(step_number):
-        return GenericStep.select(db.graph).where(step_number=step_number).first()
+    def project(fields=('step_number', 'task_name', 'duration'), order_by='step_number'):
+        '''list just the given step properties as records'''
+        return project(db.graph, 'GenericStep', fields, order_by)
+
+    @staticmethod
+    def get_by_step_number(step_number, version=None):
+        if version is None:
+            return GenericStep.select(db.graph).where(step_number=step_number).first()
+        return GenericStep.select(db.graph).where(step_number=step_number, version=version).first()
+
+    @staticmethod
+    def mask_steps(mask):
+        '''step numbers of the bits set in a step mask'''
+        return [_ for _ in range(Onboard.MAX_STEPS) if (mask or 0) >> _ & 1]
 
 
 class GenericDocument(db.Model):
 
     document_id = db.Property() 
     document_type = db.Property()
+    version = db.Property()
 
     for_step = db.RelatedTo('GenericStep')
 
     @staticmethod
-    def create(document_id, document_type):
+    def create(document_id, document_type, version=None):
         document = GenericDocument()
         document.document_id = document_id
         document.document_type = document_type
+        document.version = version
         db.graph.create(document)
         return document
 
+    @staticmethod
+    def list_with_steps():
+        '''map of document_id to document type and step number'''
+        cursor = db.graph.run((
+            "match (d:GenericDocument)-[:FOR_STEP]->(s) "
+            "return d.document_id AS document_id, d.document_type AS document_type, "
+            "s.step_number AS step_number"
+        ))
+        return dict((result['document_id'], {
+            'document_id': result['document_id'],
+            'document_type': result['document_type'],
+            'step_number': result['step_number']}) for result in cursor)
+
+    @staticmethod
+    def out_of_range_ids():
+        '''stored document ids that don't fit in an onboard's document masks'''
+        cursor = db.graph.run((
+            "match (d:GenericDocument) where d.document_id >= $max "
+            "return distinct d.document_id AS document_id order by document_id"
+        ), {'max': Onboard.MAX_DOCUMENTS})
+        return [result['document_id'] for result in cursor]
+
+    @staticmethod
+    def migrate_relationships(batch_size=1000):
+        '''move onboards from MISSING_DOCUMENT/SUBMITTED_DOCUMENT relationships
+        to the document masks, a batch of onboards per transaction
+
+        returns the number of onboards migrated, rerun to resume
+        '''
+        migrated = 0
+        while True:
+            with transaction(db.graph) as tx:
+                cursor = tx.run((
+                    "match (o:Onboard) where (o)-[:MISSING_DOCUMENT|SUBMITTED_DOCUMENT]->() "
+                    "with o limit $limit "
+                    "optional match (o)-[:MISSING_DOCUMENT]->(m) "
+                    "with o, collect(distinct m.document_id) AS missing "
+                    "optional match (o)-[:SUBMITTED_DOCUMENT]->(s) "
+                    "return id(o) AS id, missing, collect(distinct s.document_id) AS submitted"
+                ), {'limit': batch_size})
+                rows = []
+                for result in cursor:
+                    submitted = 0
+                    for document_id in result['submitted']:
+                        submitted |= Onboard.document_bit(document_id)
+                    required = submitted
+                    for document_id in result['missing']:
+                        required |= Onboard.document_bit(document_id)
+                    rows.append({'id': result['id'], 'required': required, 'submitted': submitted})
+                if not rows:
+                    break
+                tx.run((
+                    "unwind $rows AS row "
+                    "match (o) where id(o) = row.id "
+                    "set o.required_documents = row.required, o.submitted_documents = row.submitted "
+                    "with o "
+                    "match (o)-[r:MISSING_DOCUMENT|SUBMITTED_DOCUMENT]->() "
+                    "delete r"
+                ), {'rows': rows})
+            migrated += len(rows)
+        if migrated:
+            with transaction(db.graph) as tx:
+                summary.rebuild(tx)
+            cache.invalidate()
+        return migrated
+
 
 class BuildGenericProcess(object):
+    '''store a process version from the definitions file as a GenericProcess'''
 
-    def __init__(self):
-        self.generic = GenericProcess.create()
+    def __init__(self, version=None):
+        self.process = processes.get(version)
+        self.generic = GenericProcess.create(self.process.version, self.process.checksum)
         self.steps = []
         self.documents = []
-        self.tasks = [{
-            'task_name': 'get signed contracts', 
-            'duration': 3
-        }, {
-            'task_name': 'get compliance documents', 
-            'duration': 4
-        }, {
-            'task_name': 'compliance review', 
-            'duration': 3,
-        }, {
-            'task_name': 'countersign contracts', 
-            'duration': 5,
-            'depends_on': [0, 1, 2]
-        }, {
-            'task_name': 'account activation', 
-            'duration': 3,
-            'depends_on': [3]
-        }]
-        self.document_metadata = [{            
-            'type': 'signed contract', 
-            'for_step': 0
-        }, {
-            'type': 'personal identification', 
-            'for_step': 1
-        }, {
-            'type': 'tax identification', 
-            'for_step': 1
-        }, {
-            'type': 'articles of incorporation', 
-            'for_step': 1
-        }, {
-            'type': 'professional license', 
-            'for_step': 1
-        }, {
-            'type': 'miscellaneous', 
-            'for_step': 1
-        }, {
-            'type': 'compliance review', 
-            'for_step': 2
-        }, {
-            'type': 'countersign contracts', 
-            'for_step': 3
-        }, {
-            'type': 'account activation', 
-            'for_step': 4
-        }]
-        for i in range(len(self.document_metadata)):
-            self.document_metadata[i]['id'] = i
+        self.tasks = self.process.tasks
+        self.document_metadata = self.process.documents
 
     def init_steps(self):
         for step_number, task in enumerate(self.tasks):
             self.steps.append(GenericStep.create(
-                task['task_name'], step_number, task['duration'])
+                task['task_name'], step_number, task['duration'], self.process.version)
             )
         return self.steps
 
+    def _dependency_masks(self):
+        '''bitmask of the transitive dependencies of each task'''
+        return self.process.dependency_masks
+
     def init_steps_rels(self):
         
         prior_step = None
@@ -267,12 +515,18 @@ class BuildGenericProcess(object):
             
             prior_step = each_step
 
+        for each_step, dependency_mask in zip(self.steps, self._dependency_masks()):
+            each_step.dependency_mask = dependency_mask
+            db.graph.push(each_step)
+
+        self.generic.step_mask = self.process.step_mask
         db.graph.push(self.generic)
         return 'generic process steps structure built'
 
     def init_docs(self):
         for document in self.document_metadata:
-            self.documents.append(GenericDocument.create(document['id'], document['type']))
+            self.documents.append(GenericDocument.create(
+                document['id'], document['type'], self.process.version))
         return self.documents
 
     def init_docs_rels(self):
@@ -298,19 +552,37 @@ class BuildGenericProcess(object):
 
 class BuildOnboardGenericProcess(object):
 
-    def __init__(self, company_id):
+    def __init__(self, company_id, version=None):
+        self.company_id = company_id
         self.onboard = list(Client.select(db.graph).where(
             company_id=company_id
         ).first().has_onboard)[0]
-        self.generic = GenericProcess.select(db.graph).first()
+        self.generic = GenericProcess.get(version)
+        if self.generic is None:
+            raise LookupError('no stored process for version %r' % (version,))
 
     def init_rels(self):
         self.onboard.must_follow.add(self.generic)
-
-        for document in GenericDocument.select(db.graph):
-            self.onboard.missing_document.add(document)
-
-        db.graph.push(self.onboard)
+        self.onboard.process_version = self.generic.version
+        self.onboard.changed_at = arrow.utcnow().timestamp
+
+        process = processes.find(self.generic.version)
+        if process is not None:
+            required = process.required_documents
+        else:
+            required = 0
+            for document in GenericDocument.select(db.graph):
+                required |= Onboard.document_bit(document.document_id)
+        self.onboard.required_documents = required
+        self.onboard.submitted_documents = 0
+
+        with transaction(db.graph) as tx:
+            tx.push(self.onboard)
+            outbox.append(tx, [outbox.event(
+                'process_assigned', self.company_id, process_version=self.generic.version,
+                required_documents=required)])
+            summary.update(tx, [self.company_id])
+        cache.invalidate('compliance_summary')
 
         return "onboarding rels added"
 
@@ -341,12 +613,14 @@ class Action(db.Model):
     action_taken = db.RelatedTo('Action') 
 
     @staticmethod
-    def create(company_id):
+    def create(company_id, graph=None):
+        if graph is None:
+            graph = db.graph
         action = Action()
         a = arrow.utcnow()
         action.number = action.get_num_actions(company_id)
         action.taken_at = a.timestamp
-        db.graph.create(action)
+        graph.create(action)
         return action
 
     def _is_client_onboard_structure_built(self, company_id):
@@ -379,9 +653,16 @@ class Action(db.Model):
 
     def add_has_completed_rel(self, company_id, step_number):
         if self._structure_is_built(company_id):
-            step = GenericStep.get_by_step_number(step_number)
+            version = db.graph.run((
+                "match (:Client {company_id: $company_id})-[:HAS_ONBOARD]->(o) "
+                "return o.process_version"
+            ), {'company_id': company_id}).evaluate()
+            step = GenericStep.get_by_step_number(step_number, version)
             self.has_completed.add(step)
             db.graph.push(self)
+            # steps outside the mask range can't be part of a process
+            if 0 <= step_number < Onboard.MAX_STEPS:
+                Onboard.record_step(company_id, step_number)
             return self
         raise LookupError('required graph structure missing')
 
@@ -414,74 +695,113 @@ class BuildAction(object):
         ).first().has_onboard)[0]
         self.activity = [_ for _ in self.onboard.has_activity][0]
         self.actions = None
+        # the compiled process the onboard is pinned to, if any
+        self.process = processes.find(self.onboard.process_version)
 
-    def _num_dependencies(self, step_number):
+    def _step_masks(self, step_number):
+        '''the onboard's completed mask and the step's dependency mask'''
+        if self.process is not None:
+            cursor = db.graph.run((
+                "match (:Client {company_id: $company_id})-[:HAS_ONBOARD]->(o) "
+                "return coalesce(o.completed_steps, 0) AS completed"
+            ), {'company_id': self.company_id})
+            if not cursor.forward():
+                raise LookupError('required graph structure missing')
+            return cursor.current()['completed'], self.process.dependency_mask(step_number)
+        # the step of the stored process version the onboard follows
         cursor = db.graph.run((
-            "match (s:GenericStep)-[:DEPENDS_ON*]->(ds) "
-            "where s.step_number=%d "
-            "return count(ds) AS num_depends" % step_number
-        ))
-        return cursor.next()['num_depends']
+            "match (:Client {company_id: $company_id})-[:HAS_ONBOARD]->(o) "
+            "optional match (o)-[:MUST_FOLLOW]->(:GenericProcess)-[:HAS_STEP]->"
+            "(s:GenericStep {step_number: $step_number}) "
+            "return coalesce(o.completed_steps, 0) AS completed, "
+            "coalesce(s.dependency_mask, 0) AS depends"
+        ), {'company_id': self.company_id, 'step_number': step_number})
+        if not cursor.forward():
+            raise LookupError('required graph structure missing')
+        return cursor.current()['completed'], cursor.current()['depends']
+
+    def _num_dependencies(self, step_number):
+        completed, depends = self._step_masks(step_number)
+        return len(GenericStep.mask_steps(depends))
 
     def _completed_dependencies(self, step_number):
-        cursor = db.graph.run((
-            "match (s:GenericStep {step_number: %d})-[:DEPENDS_ON*]->(ds) "
-            "match (ds)<-[:HAS_COMPLETED]-(action) "
-            "match (:Client {company_id: '%s'})-[:HAS_ONBOARD]->()-[:HAS_ACTIVITY]->(activity) "
-            "match (activity)-[:ACTION_TAKEN*]->(action) "
-            "return distinct ds order by ds.step_number" % (step_number, self.company_id)
-        ))
-        return [result['ds']['step_number'] for result in cursor]
+        completed, depends = self._step_masks(step_number)
+        return GenericStep.mask_steps(completed & depends)
 
     def _depends_satisfied(self, step_number):
-        number_of_depends = self._num_dependencies(step_number)
-        completed_depends = self._completed_dependencies(step_number)
-        if number_of_depends == len(completed_depends):
-            return True
-        return False
+        completed, depends = self._step_masks(step_number)
+        return completed & depends == depends
 
     def _mark_onboard_complete(self):
-        a = arrow.utcnow()
-        self.onboard.completed = True
-        self.onboard.time_completed = a.timestamp
-        db.graph.push(self.onboard)
+        now = arrow.utcnow().timestamp
+        with transaction(db.graph) as tx:
+            tx.run((
+                "match (:Client {company_id: $company_id})-[:HAS_ONBOARD]->(o) "
+                "set o.completed = true, o.time_completed = $now, o.changed_at = $now"
+            ), {'company_id': self.company_id, 'now': now})
+            outbox.append(tx, [outbox.event('onboard_completed', self.company_id, time_completed=now)])
+            summary.update(tx, [self.company_id])
+        cache.invalidate('compliance_summary', 'average_ttc')
         return 'onboard process marked complete'
 
-    def _step_aware_mark_onboard_complete(self):
-        '''will mark the onboard process as complete if all the generic steps have been completed'''
-        if len(list(self.onboard.has_completed)) == len(GenericStep.all()):
-            self._mark_onboard_complete()
-        return 'onboard process not complete'
-
-    def _mark_step_complete(self, step_number):
-        step = GenericStep.select(db.graph).where(
-            step_number=step_number
-        ).first()
-        self.onboard.has_completed.add(step)
-        db.graph.push(self.onboard)
-        return "marked step %d as complete" % step_number
-
-    def _mark_step_invalid(self, step_number):
-        step = GenericStep.select(db.graph).where(
-            step_number=step_number
-        ).first()
-        self.onboard.invalid.add(step)
-        self.onboard.valid_onboard = False
-        db.graph.push(self.onboard)
-        return "marked step %d as invalid" % step_number
-
-    def _dependency_aware_mark_step_complete(self, step_number):
-        if self._depends_satisfied(step_number):
-            self._mark_step_complete(step_number)
-            return "step marked as valid and complete"
-        self._mark_step_complete(step_number)
-        self._mark_step_invalid(step_number)
-        return "step marked as invalid and complete"
+    # dependency check, step completion, invalidation and onboard completion
+    # in one statement, under the onboard's _lock
+    AWARE_MARK_STEP_COMPLETE = (
+        "match (:Client {company_id: $company_id})-[:HAS_ONBOARD]->(o)-[:MUST_FOLLOW]->(p:GenericProcess) "
+        "match (p)-[:HAS_STEP]->(s:GenericStep {step_number: $step_number}) "
+        "set o._lock = true "
+        "with o, s, coalesce(p.step_mask, 0) AS step_mask, "
+        "  coalesce(o.completed_steps, 0) AS completed, "
+        "  coalesce(o.invalid_steps, 0) AS invalid, "
+        "  coalesce(s.dependency_mask, 0) AS depends "
+        "with o, s, step_mask, invalid, completed, "
+        "  CASE WHEN (completed / $bit) % 2 = 1 THEN completed ELSE completed + $bit END AS now_completed, "
+        "  all(i IN range(0, 62) WHERE (depends / toInteger(2 ^ i)) % 2 = 0 "
+        "    OR (completed / toInteger(2 ^ i)) % 2 = 1) AS satisfied "
+        "with o, s, satisfied, completed, now_completed, "
+        "  CASE WHEN satisfied OR (invalid / $bit) % 2 = 1 THEN invalid ELSE invalid + $bit END AS now_invalid, "
+        "  step_mask > 0 AND all(i IN range(0, 62) WHERE (step_mask / toInteger(2 ^ i)) % 2 = 0 "
+        "    OR (now_completed / toInteger(2 ^ i)) % 2 = 1) AS all_done "
+        "set o.completed_steps = now_completed, "
+        "  o.invalid_steps = now_invalid, "
+        "  o.last_step_at = CASE WHEN now_completed = completed THEN o.last_step_at ELSE $now END, "
+        "  o.changed_at = $now, "
+        "  o.valid_onboard = coalesce(o.valid_onboard, true) AND satisfied, "
+        "  o.time_completed = CASE WHEN all_done AND NOT coalesce(o.completed, false) "
+        "    THEN $now ELSE o.time_completed END, "
+        "  o.completed = coalesce(o.completed, false) OR all_done "
+        "merge (o)-[:HAS_COMPLETED]->(s) "
+        "foreach (_ IN CASE WHEN satisfied THEN [] ELSE [1] END | merge (o)-[:INVALID]->(s)) "
+        "remove o._lock "
+        "return satisfied, o.completed_steps AS completed_steps, o.invalid_steps AS invalid_steps, "
+        "  o.valid_onboard AS valid_onboard, o.completed AS completed, o.time_completed AS time_completed"
+    )
 
     def aware_mark_step_complete(self, step_number):
-        self._dependency_aware_mark_step_complete(step_number)
-        self._step_aware_mark_onboard_complete()
-        return "recorded action for step %d and appropriately adjusted onboard activity" % step_number
+        '''mark a step complete (and invalid if its dependencies are not met),
+        completing the onboard once all steps are done, in one round trip
+
+        returns the new onboard state
+        '''
+        with transaction(db.graph) as tx:
+            cursor = tx.run(self.AWARE_MARK_STEP_COMPLETE, {
+                'company_id': self.company_id,
+                'step_number': step_number,
+                'bit': Onboard.step_bit(step_number),
+                'now': arrow.utcnow().timestamp})
+            tx.process()
+            if not cursor.forward():
+                raise LookupError('required graph structure missing')
+            state = dict((key, cursor.current()[key]) for key in (
+                'satisfied', 'completed_steps', 'invalid_steps',
+                'valid_onboard', 'completed', 'time_completed'))
+            outbox.append(tx, [outbox.event(
+                'step_completed', self.company_id, step_number=step_number,
+                invalid=not state['satisfied'], completed_steps=state['completed_steps'],
+                invalid_steps=state['invalid_steps'], completed=state['completed'])])
+            summary.update(tx, [self.company_id])
+        cache.invalidate('compliance_summary', 'average_ttc')
+        return state
 
     def _update_actions(self):
         cursor = db.graph.run((
@@ -491,23 +811,29 @@ class BuildAction(object):
         self.actions = [_ for _ in cursor]
         return self.actions
 
-    def _is_first_action(self):
-        cursor = db.graph.run((
+    def _is_first_action(self, graph=None):
+        if graph is None:
+            graph = db.graph
+        cursor = graph.run((
             "match (:Client {company_id: '%s'})-[:HAS_ONBOARD]->()-[:HAS_ACTIVITY]->()-[:ACTION_TAKEN]->(action) "
             "return action" % self.company_id
         ))
         return not cursor.forward()
 
-    def _add_first_action(self):
-        action = Action.create(self.company_id)
-        db.graph.push(action)
+    def _add_first_action(self, graph=None):
+        if graph is None:
+            graph = db.graph
+        action = Action.create(self.company_id, graph)
+        graph.push(action)
         self.activity.action_taken.add(action)
         self.activity.first_action.add(action)
         self.activity.last_action.add(action)
-        db.graph.push(self.activity)
+        graph.push(self.activity)
         return action
 
-    def _get_and_move_last_action(self, new_action):
+    def _get_and_move_last_action(self, new_action, graph=None):
+        if graph is None:
+            graph = db.graph
 
         last_action = [_ for _ in self.activity.last_action][0]
 
@@ -515,26 +841,32 @@ class BuildAction(object):
         self.activity.last_action.remove(last_action)
         self.activity.last_action.add(new_action)
 
-        db.graph.push(self.activity)
-        db.graph.push(last_action)
+        graph.push(self.activity)
+        graph.push(last_action)
 
         return last_action
 
-    def _add_next_action(self):
-        new_action = Action.create(self.company_id)
-        db.graph.push(new_action)
-        last_action = self._get_and_move_last_action(new_action)
-        db.graph.push(last_action)
+    def _add_next_action(self, graph=None):
+        if graph is None:
+            graph = db.graph
+        new_action = Action.create(self.company_id, graph)
+        graph.push(new_action)
+        last_action = self._get_and_move_last_action(new_action, graph)
+        graph.push(last_action)
         return new_action
 
-    def _new_action(self):
-        if self._is_first_action():
-            return self._add_first_action()
-        return self._add_next_action()
+    def _new_action(self, graph=None):
+        if self._is_first_action(graph):
+            return self._add_first_action(graph)
+        return self._add_next_action(graph)
 
     def new_action(self, step_number):
         '''add a new action node optionally marking a step as completed'''
-        action = self._new_action()
+        # the action's pushes and its event commit together
+        with transaction(db.graph) as tx:
+            action = self._new_action(tx)
+            outbox.append(tx, [outbox.event(
+                'action_appended', self.company_id, number=action.number, step_number=step_number)])
         action.add_has_completed_rel(self.company_id, step_number)
         # self.aware_mark_step_complete(step_number)
         return action 
@@ -550,12 +882,80 @@ class UpdateClientOnboard(object):
         ).first().has_onboard)[0]
 
     def submit_document(self, document_id):
-        document = GenericDocument.select(db.graph).where(document_id=document_id).first()
-        self.onboard.submitted_document.add(document)
-        self.onboard.missing_document.remove(document)
-        db.graph.push(self.onboard)
+        accepted = UpdateClientOnboard._submit_documents_batch([{
+            'company_id': self.company_id,
+            'bits': [Onboard.document_bit(document_id)]}])
+        db.graph.pull(self.onboard)
+        if not accepted.get(self.company_id):
+            return 'document_%d was not missing' % document_id
         return 'marked document_%d as submitted' % document_id
 
+    @staticmethod
+    def _submit_documents_batch(batch):
+        '''set the submitted bits of each row's onboard, returns the bits accepted per client'''
+        # _lock the onboard before reading its masks, see graphdb.transaction
+        with transaction(db.graph) as tx:
+            cursor = tx.run((
+                "UNWIND $rows AS row "
+                "OPTIONAL MATCH (:Client {company_id: row.company_id})-[:HAS_ONBOARD]->(o) "
+                "SET o._lock = true "
+                "WITH row, o, [bit IN row.bits WHERE o IS NOT NULL "
+                "  AND (coalesce(o.required_documents, 0) / bit) % 2 = 1 "
+                "  AND (coalesce(o.submitted_documents, 0) / bit) % 2 = 0] AS accepted "
+                "SET o.submitted_documents = coalesce(o.submitted_documents, 0) "
+                "  + reduce(total = 0, bit IN accepted | total + bit) "
+                "REMOVE o._lock "
+                "RETURN row.company_id AS company_id, accepted"
+            ), {'rows': batch})
+            tx.process()
+            accepted = dict((result['company_id'], result['accepted']) for result in cursor)
+            submitted = sorted(company_id for company_id, bits in accepted.items() if bits)
+            outbox.append(tx, [outbox.event(
+                'documents_submitted', company_id,
+                document_ids=[_ for _ in range(Onboard.MAX_DOCUMENTS) if 1 << _ in accepted[company_id]])
+                for company_id in submitted])
+            if submitted:
+                # missing document counts are part of the compliance summary
+                summary.update(tx, submitted)
+        if submitted:
+            cache.invalidate('compliance_summary')
+        return accepted
+
+    @staticmethod
+    def submit_documents(submissions, batch_size=1000):
+        '''mark many (company_id, document_id) pairs as submitted, one transaction per batch
+
+        returns one result per pair, submitted is False when the client
+        is unknown or the document was not missing for it. a pair repeated
+        within the request gets the same result each time
+        '''
+        results = []
+        # one row per client so each onboard's mask is written once per batch
+        bits = {}
+        for index, (company_id, document_id) in enumerate(submissions):
+            results.append({
+                'company_id': company_id,
+                'document_id': document_id,
+                'submitted': False})
+            try:
+                bit = Onboard.document_bit(document_id)
+            except ValueError:
+                continue
+            bits.setdefault(company_id, {}).setdefault(bit, []).append(index)
+
+        # batches take onboard locks in company_id order, so concurrent
+        # submissions can't lock the same onboards in opposite orders
+        rows = [{'company_id': company_id, 'bits': sorted(indexes)}
+                for company_id, indexes in sorted(
+                    bits.items(), key=lambda _: (type(_[0]).__name__, _[0]))]
+        for start in range(0, len(rows), batch_size):
+            accepted = UpdateClientOnboard._submit_documents_batch(rows[start:start + batch_size])
+            for company_id, accepted_bits in accepted.items():
+                for bit in accepted_bits:
+                    for index in bits[company_id][bit]:
+                        results[index]['submitted'] = True
+        return results
+
 
 class Company(db.Model):
 
@@ -596,8 +996,20 @@ class Employee(db.Model):
         employee.id = employee_id
         employee.email = employee_email
         db.graph.push(employee)
+        cache.invalidate('access_matrix')
         return employee
 
+    @staticmethod
+    @cache.memoize('access_matrix')
+    def access_matrix():
+        '''every employee's application access in one query, see matrix.py'''
+        cursor = db.graph.run((
+            "MATCH (e:Employee) "
+            "OPTIONAL MATCH (e)-[:HAS_ACCESS_TO]->(a:Application) "
+            "RETURN e.id AS employee_id, collect(a.name) AS applications"
+        ))
+        return matrix.build((result['employee_id'], result['applications']) for result in cursor)
+
 
 class BuildEmployeeCompany(object):
     
@@ -659,14 +1071,62 @@ class UpdateEmployeeAccess(object):
         self.employee_id = employee_id
 
     def update_step_access(self, client_id, step_number):
-        return db.graph.run(
-            "MATCH (e:Employee)-[:WORKED_ON]->(p:Project)-[:FOR_CLIENT]->(c:Client) " +
-            "WHERE e.id='%s' AND c.company_id='%s' " % (self.employee_id, client_id) +
-            "MATCH (c)-[:HAS_ONBOARD]->()-[:MUST_FOLLOW]->()-[:HAS_STEP]->(s) " + 
-            "WHERE s.step_number=%s " % str(step_number) +
-            "MERGE (p)-[:ACCESSED_STEP]->(s) " +
-            "RETURN e"
-        )
+        return UpdateEmployeeAccess.record_step_access(
+            [(self.employee_id, client_id, step_number)])
+
+    @staticmethod
+    def _record_step_access_batch(rows, now):
+        '''merge ACCESSED_STEP for rows of {index, employee_id, client_id,
+        step_number, count}, returns the indexes of the rows that matched'''
+        with transaction(db.graph) as tx:
+            cursor = tx.run((
+                "UNWIND $rows AS row "
+                "MATCH (e:Employee {id: row.employee_id})-[:WORKED_ON]->(p:Project)"
+                "-[:FOR_CLIENT]->(c:Client {company_id: row.client_id}) "
+                "MATCH (c)-[:HAS_ONBOARD]->()-[:MUST_FOLLOW]->()-[:HAS_STEP]->(s:GenericStep) "
+                "WHERE s.step_number = row.step_number "
+                "MERGE (p)-[a:ACCESSED_STEP]->(s) "
+                "SET a.count = coalesce(a.count, 0) + row.count, a.accessed_at = $now "
+                "RETURN DISTINCT row.index AS index"
+            ), {'rows': rows, 'now': now})
+            tx.process()
+            matched = set(result['index'] for result in cursor)
+            outbox.append(tx, [outbox.event(
+                'step_accessed', row['employee_id'], client_id=row['client_id'],
+                step_number=row['step_number'], count=row['count'])
+                for row in rows if row['index'] in matched], now)
+        return matched
+
+    @staticmethod
+    def record_step_access(accesses, batch_size=1000):
+        '''log many (employee_id, client_id, step_number) accesses, one UNWIND per batch
+
+        repeated tuples are counted once each onto the relationship; returns
+        the number of distinct accesses recorded and the unmatched tuples
+        '''
+        counts = {}
+        for access in accesses:
+            employee_id, client_id, step_number = access
+            key = (employee_id, client_id, int(step_number))
+            counts[key] = counts.get(key, 0) + 1
+
+        rows = [{
+            'index': index,
+            'employee_id': key[0],
+            'client_id': key[1],
+            'step_number': key[2],
+            'count': count} for index, (key, count) in enumerate(sorted(counts.items()))]
+
+        now = arrow.utcnow().timestamp
+        matched = set()
+        for start in range(0, len(rows), batch_size):
+            matched |= UpdateEmployeeAccess._record_step_access_batch(
+                rows[start:start + batch_size], now)
+
+        return {
+            'recorded': len(matched),
+            'unmatched': [(_['employee_id'], _['client_id'], _['step_number'])
+                          for _ in rows if _['index'] not in matched]}
 
 
 class Application(db.Model):
@@ -683,6 +1143,9 @@ class Application(db.Model):
     # accessed_by = db.RelatedFrom('Employee')
     uses_database = db.RelatedTo('Database')
 
+    # the role labels an application can carry
+    ROLES = ('Crm', 'Erp', 'Compliance', 'Cloud')
+
     @staticmethod
     def push_crm(app_name):
         crm_app = Application()
@@ -690,6 +1153,7 @@ class Application(db.Model):
         crm_app.cloud = True
         crm_app.name = app_name
         db.graph.push(crm_app)
+        cache.invalidate('application_roles', 'access_matrix')
         return crm_app
 
     @staticmethod
@@ -698,6 +1162,7 @@ class Application(db.Model):
         erp_app.erp = True
         erp_app.name = app_name
         db.graph.push(erp_app)
+        cache.invalidate('application_roles', 'access_matrix')
         return erp_app
 
     @staticmethod
@@ -706,7 +1171,29 @@ class Application(db.Model):
         comp_app.compliance = True
         comp_app.name = app_name
         db.graph.push(comp_app)
+        cache.invalidate('application_roles', 'access_matrix')
         return comp_app
+
+    @staticmethod
+    def name_by_role(role):
+        '''name of the (first created) application with a role label, via a label scan'''
+        if role not in Application.ROLES:
+            raise ValueError('unknown application role %r' % (role,))
+        return db.graph.run((
+            "MATCH (a:Application:`%s`) "
+            "RETURN a.name ORDER BY id(a) LIMIT 1" % role
+        )).evaluate()
+
+    @staticmethod
+    @cache.memoize('application_roles')
+    def role_map():
+        '''map of role label to application name'''
+        names = {}
+        for role in Application.ROLES:
+            name = Application.name_by_role(role)
+            if name is not None:
+                names[role] = name
+        return names
         
 
 class Database(db.Model):
@@ -770,18 +1257,64 @@ class EmployeeAppAccess(object):
         self.employee_id = employee_id
 
     def build(self):
-        employee = Employee.select(db.graph).where(
-          "_.id='%s'" % self.employee_id
-        ).first()
-        
-        app = Application.select(db.graph).where(
-          "'%s' IN labels(_)" % self.app_label
-        ).first()
+        name = Application.role_map().get(self.app_label)
+        if name is None:
+            raise LookupError('no application with role %s' % self.app_label)
+
+        # primary key selects, served by the Employee(id)/Application(name) indexes
+        employee = Employee.select(db.graph, self.employee_id).first()
+        app = Application.select(db.graph, name).first()
 
         employee.has_access_to.add(app)
-        db.graph.push(employee)
+        with transaction(db.graph) as tx:
+            tx.push(employee)
+            outbox.append(tx, [outbox.event('access_granted', self.employee_id, application=name)])
+        cache.invalidate('access_matrix')
         return 'built employee app access'
 
+    @staticmethod
+    def _grant_batch(rows):
+        '''merge HAS_ACCESS_TO for rows of {index, employee_id, app_name},
+        returns the indexes of the rows that matched'''
+        with transaction(db.graph) as tx:
+            cursor = tx.run((
+                "UNWIND $rows AS row "
+                "MATCH (e:Employee {id: row.employee_id}) "
+                "MATCH (a:Application {name: row.app_name}) "
+                "MERGE (e)-[:HAS_ACCESS_TO]->(a) "
+                "RETURN DISTINCT row.index AS index"
+            ), {'rows': rows})
+            tx.process()
+            matched = set(result['index'] for result in cursor)
+            outbox.append(tx, [outbox.event(
+                'access_granted', row['employee_id'], application=row['app_name'])
+                for row in rows if row['index'] in matched])
+        return matched
+
+    @staticmethod
+    def grant(grants, batch_size=1000):
+        '''grant many (employee_id, role) pairs, one UNWIND per batch
+
+        roles are resolved through the cached role map; returns the number
+        of pairs granted and the pairs with an unknown employee or role
+        '''
+        roles = Application.role_map()
+        pairs = sorted(set((employee_id, role) for employee_id, role in grants))
+        rows = [{
+            'index': index,
+            'employee_id': employee_id,
+            'app_name': roles[role]} for index, (employee_id, role) in enumerate(pairs)
+            if role in roles]
+
+        matched = set()
+        for start in range(0, len(rows), batch_size):
+            matched |= EmployeeAppAccess._grant_batch(rows[start:start + batch_size])
+        cache.invalidate('access_matrix')
+
+        return {
+            'granted': len(matched),
+            'unmatched': [pair for index, pair in enumerate(pairs) if index not in matched]}
+
 
 def build_model():
     '''builds a sample data set using the model'''
@@ -849,7 +1382,7 @@ def build_model():
     app_access_3.build()
 
     update_cli_1 = UpdateClientOnboard(COMPANY_ID_1)
-    for i in range(len(GenericStep.all())):
+    for i in range(len(GenericStep.project(('step_number',)))):
         update_cli_1.aware_mark_step_complete(i)
 
     update_cli_2 = UpdateClientOnboard(COMPANY_ID_2)
@@ -0,0 +1,85 @@
+'''change events for consumers that want deltas instead of the graph
+
+model writes append compact events to the outbox in the same
+transaction as the write. each event gets the next offset from a
+sequence node whose write lock is held until commit, so events become
+visible in offset order and a consumer resumes by reading after the
+last offset it saw
+
+the one sequence node serializes every writing transaction from its
+append to its commit, so writes that append are bounded to one at a
+time for however long each runs after appending. sharding the sequence
+would lift the bound, but offsets would then be ordered only within a
+shard
+'''
+import json
+import time
+
+APPEND = (
+    "MERGE (q:OutboxSequence {name: 'changes'}) "
+    "ON CREATE SET q.last = 0 "
+    "SET q._lock = true "
+    "WITH q, q.last AS last "
+    "UNWIND range(0, size($events) - 1) AS i "
+    "CREATE (:ChangeEvent {offset: last + i + 1, kind: $events[i].kind, "
+    "  key: $events[i].key, data: $events[i].data, at: $at}) "
+    "WITH q, last LIMIT 1 "
+    "SET q.last = last + size($events) "
+    "REMOVE q._lock "
+    "RETURN q.last"
+)
+
+READ = (
+    "MATCH (e:ChangeEvent) WHERE e.offset > $after "
+    "RETURN e.offset AS offset, e.kind AS kind, e.key AS key, e.data AS data, e.at AS at "
+    "ORDER BY e.offset LIMIT $limit"
+)
+
+
+def event(kind, key, **data):
+    '''an event of a kind about the node with key, data kept as compact json'''
+    return {'kind': kind, 'key': key, 'data': json.dumps(data, sort_keys=True, separators=(',', ':'))}
+
+
+def append(graph, events, now=None):
+    '''append events to the outbox through a graph or transaction
+
+    returns the offset of the last one, None when there are no events
+    '''
+    if not events:
+        return None
+    now = int(time.time()) if now is None else now
+    return graph.run(APPEND, {'events': list(events), 'at': now}).evaluate()
+
+
+def read(graph, after=0, limit=1000):
+    '''up to limit events after an offset, in offset order'''
+    cursor = graph.run(READ, {'after': after, 'limit': limit})
+    return [{
+        'offset': result['offset'],
+        'kind': result['kind'],
+        'key': result['key'],
+        'data': json.loads(result['data']),
+        'at': result['at']} for result in cursor]
+
+
+def follow(graph, after=0, limit=1000, wait=0, interval=0.5):
+    '''yield up to limit events after an offset, polling for up to wait seconds'''
+    deadline = time.time() + wait
+    while limit > 0:
+        events = read(graph, after, limit)
+        for each_event in events:
+            yield each_event
+        if events:
+            after = events[-1]['offset']
+            limit -= len(events)
+            continue
+        if time.time() >= deadline:
+            return
+        time.sleep(interval)
+
+
+def iter_ndjson(events):
+    '''one json document per line'''
+    for each_event in events:
+        yield json.dumps(each_event, sort_keys=True) + '\n'
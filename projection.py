@@ -0,0 +1,106 @@
+'''compact records for list queries that only need a few properties
+
+rather than hydrating OGM objects or nodes, a projection returns just
+the requested properties straight from the cursor, either one
+namedtuple record per row or one array per column, numeric columns as
+numpy float arrays with NaN for missing values and integer columns (e.g.
+bitmasks, which don't fit a float's 53 bit mantissa) as int64 arrays
+with 0 for missing values
+'''
+import re
+from collections import namedtuple
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_]\w*$')
+
+_record_types = {}
+
+try:
+    _text = basestring
+except NameError:
+    _text = str
+
+
+class Record(object):
+    '''mixed into namedtuples so a record is also readable as record['name']'''
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, _text):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        return tuple.__getitem__(self, key)
+
+    def __reduce__(self):
+        # record classes are created at runtime, so rebuild them by name and fields
+        return (_rebuild, (type(self).__name__, self._fields, tuple(self)))
+
+
+def _rebuild(name, fields, values):
+    return record_type(name, fields)(*values)
+
+
+def record_type(name, fields):
+    '''the namedtuple record class with these fields, created once per name and fields'''
+    fields = tuple(fields)
+    for field in fields:
+        if not _IDENTIFIER.match(field) or field.startswith('_'):
+            raise ValueError('invalid field name %r' % (field,))
+    key = (name, fields)
+    if key not in _record_types:
+        _record_types[key] = type(str(name), (Record, namedtuple(str(name), fields)), {
+            '__slots__': ()})
+    return _record_types[key]
+
+
+def records(cursor, record):
+    '''one record per cursor row, the row's values in field order'''
+    return [record(*values) for values in cursor]
+
+
+def columns(cursor, fields, numeric=(), integer=()):
+    '''the cursor's rows as a dict of one list per field, numeric and integer fields as arrays'''
+    # numpy is imported on first use to keep it off the startup path
+    import numpy as np
+
+    values = [[] for _ in fields]
+    for row in cursor:
+        for column, value in zip(values, row):
+            column.append(value)
+    result = {}
+    for field, column in zip(fields, values):
+        if field in integer:
+            column = np.array([0 if _ is None else _ for _ in column], dtype=np.int64)
+        elif field in numeric:
+            column = np.array([np.nan if _ is None else _ for _ in column], dtype=np.float64)
+        result[field] = column
+    return result
+
+
+def _statement(label, fields, order_by):
+    if not _IDENTIFIER.match(label):
+        raise ValueError('invalid label %r' % (label,))
+    for field in fields:
+        if not _IDENTIFIER.match(field):
+            raise ValueError('invalid field name %r' % (field,))
+    if order_by is not None and order_by not in fields:
+        raise ValueError('can only order by a projected field')
+    statement = "MATCH (n:%s) RETURN %s" % (
+        label, ', '.join('n.%s AS %s' % (_, _) for _ in fields))
+    if order_by is not None:
+        statement += " ORDER BY %s" % order_by
+    return statement
+
+
+def project(graph, label, fields, order_by=None):
+    '''the given properties of every node with a label as records'''
+    record = record_type('%sProjection' % label, fields)
+    return records(graph.run(_statement(label, record._fields, order_by)), record)
+
+
+def project_columns(graph, label, fields, numeric=(), order_by=None, integer=()):
+    '''the given properties of every node with a label as columns'''
+    fields = tuple(fields)
+    return columns(graph.run(_statement(label, fields, order_by)), fields, numeric, integer)
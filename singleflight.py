@@ -0,0 +1,84 @@
+import copy
+import functools
+import threading
+
+
+class _Call(object):
+    '''an in-flight call that other callers can wait on'''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    '''coalesce identical concurrent calls within a worker
+
+    the first caller for a key runs the function, every caller that
+    arrives while it is still running waits and gets a copy of the same
+    result (or the same exception) instead of running it again
+
+    scope, if given, is called for a string added to every coalesced
+    key, e.g. so calls against different graphs are never shared; bypass,
+    if given, is called before each call and when true the call runs on
+    its own, e.g. for a request that must read its own writes
+    '''
+
+    def __init__(self, scope=None, bypass=None):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.scope = scope
+        self.bypass = bypass
+
+    def after_fork(self):
+        '''drop locks and calls inherited from the parent process'''
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # the leader's caller owns the result, the followers get their own
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def coalesce(self, name):
+        '''decorator sharing one execution between identical concurrent calls'''
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if self.bypass is not None and self.bypass():
+                    return func(*args, **kwargs)
+                key = '%s:%r:%r' % (name, args, sorted(kwargs.items()))
+                if self.scope is not None:
+                    key = '%s:%s' % (self.scope(), key)
+                return self.do(key, func, *args, **kwargs)
+            return wrapper
+        return decorator
@@ -0,0 +1,125 @@
+'''incremental detection of onboards with an overdue step
+
+a step is due its duration (in days) after the onboard's previous step
+completion, or its creation, once all of its dependencies are complete;
+each onboard keeps the earliest due time of its pending steps in an
+indexed next_due property, so a scan only reads onboards that changed
+or whose next_due passed since the last scan
+'''
+from definitions import DAY
+
+# the scan bookkeeping node
+SCAN_LABEL = 'SlaScan'
+
+
+class SlaScanner(object):
+    '''record overdue steps as (:Onboard)-[:HAS_BREACH]->(:Breach) nodes'''
+
+    def __init__(self, graph, processes, batch_size=1000):
+        self.graph = graph
+        self.processes = processes
+        self.batch_size = batch_size
+
+    def ensure_indexes(self):
+        self.graph.run("CREATE INDEX ON :Onboard(next_due)")
+        self.graph.run("CREATE INDEX ON :Onboard(changed_at)")
+
+    def last_run(self):
+        return self.graph.run("MATCH (s:%s) RETURN max(s.last_run)" % SCAN_LABEL).evaluate()
+
+    def candidates(self, last_run, now):
+        '''active onboards changed, or with a deadline passed, since last_run
+
+        timestamps are in whole seconds, so onboards changed in the second
+        of the last run are read again in case they changed after it
+        '''
+        returns = (
+            "RETURN id(o) AS id, c.company_id AS company_id, o.process_version AS version, "
+            "o.completed_steps AS completed_steps, o.last_step_at AS last_step_at, "
+            "o.time_created AS time_created"
+        )
+        if last_run is None:
+            statements = [(
+                "MATCH (c:Client)-[:HAS_ONBOARD]->(o) "
+                "WHERE NOT coalesce(o.completed, false) " + returns
+            )]
+        else:
+            statements = [(
+                "MATCH (o:Onboard) WHERE o.changed_at >= $last_run "
+                "MATCH (c:Client)-[:HAS_ONBOARD]->(o) "
+                "WHERE NOT coalesce(o.completed, false) " + returns
+            ), (
+                "MATCH (o:Onboard) WHERE o.next_due > $last_run AND o.next_due <= $now "
+                "MATCH (c:Client)-[:HAS_ONBOARD]->(o) "
+                "WHERE NOT coalesce(o.completed, false) " + returns
+            )]
+        onboards = {}
+        for statement in statements:
+            for result in self.graph.run(statement, {'last_run': last_run, 'now': now}):
+                onboards[result['id']] = dict(result)
+        return [onboards[_] for _ in sorted(onboards)]
+
+    def evaluate(self, onboard, now):
+        '''the overdue steps and next due time of one onboard'''
+        process = self.processes.find(onboard['version']) or self.processes.latest
+        completed = onboard['completed_steps'] or 0
+        since = onboard['last_step_at']
+        if since is None:
+            since = onboard['time_created'] if onboard['time_created'] is not None else now
+
+        overdue = []
+        next_due = None
+        for step_number, task in enumerate(process.tasks):
+            depends = process.dependency_mask(step_number)
+            if completed >> step_number & 1 or completed & depends != depends:
+                continue
+            due = since + (task.get('duration') or 0) * DAY
+            if due <= now:
+                overdue.append({'step_number': step_number, 'due_at': due})
+            elif next_due is None or due < next_due:
+                next_due = due
+        return overdue, next_due
+
+    def _write(self, rows, now):
+        self.graph.run((
+            "UNWIND $rows AS row "
+            "MATCH (o) WHERE id(o) = row.id "
+            "SET o.next_due = row.next_due "
+            "WITH o, row "
+            "UNWIND row.overdue AS step "
+            "MERGE (o)-[:HAS_BREACH]->(b:Breach {step_number: step.step_number, due_at: step.due_at}) "
+            "ON CREATE SET b.company_id = row.company_id, b.detected_at = $now"
+        ), {'rows': rows, 'now': now})
+
+    def run(self, now):
+        '''scan what changed since the last run, returns counts'''
+        last_run = self.last_run()
+        onboards = self.candidates(last_run, now)
+
+        rows = []
+        breaches = 0
+        for onboard in onboards:
+            overdue, next_due = self.evaluate(onboard, now)
+            breaches += len(overdue)
+            rows.append({
+                'id': onboard['id'],
+                'company_id': onboard['company_id'],
+                'next_due': next_due,
+                'overdue': overdue})
+        for start in range(0, len(rows), self.batch_size):
+            self._write(rows[start:start + self.batch_size], now)
+
+        self.graph.run((
+            "MERGE (s:%s) SET s.last_run = $now" % SCAN_LABEL
+        ), {'now': now})
+        return {'scanned': len(onboards), 'overdue': breaches, 'last_run': last_run}
+
+    def breaches(self, limit=100):
+        cursor = self.graph.run((
+            "MATCH (o)-[:HAS_BREACH]->(b:Breach) "
+            "RETURN b.company_id AS company_id, b.step_number AS step_number, "
+            "b.due_at AS due_at, b.detected_at AS detected_at, "
+            "coalesce(o.completed_steps, 0) / toInteger(2 ^ b.step_number) % 2 = 1 AS resolved "
+            "ORDER BY b.detected_at DESC, b.due_at DESC LIMIT $limit"
+        ), {'limit': limit})
+        return [dict(result) for result in cursor]
@@ -0,0 +1,193 @@
+'''dump the whole graph to a compact binary snapshot and restore it
+
+a snapshot stores each distinct label set and relationship type once,
+nodes as (label set index, properties) and relationships as
+(type index, start node index, end node index, properties), where node
+indexes are positions in the node list rather than neo4j ids
+
+the structure is stored as zlib compressed json, so restoring a file
+from elsewhere can't run code the way unpickling would
+'''
+import json
+import zlib
+
+MAGIC = b'NEO4JSNAP'
+# version 1 was pickled and is no longer read
+FORMAT_VERSION = 2
+
+# temporary label/property used to match restored nodes by snapshot index
+RESTORE_LABEL = '_SnapshotRestore'
+RESTORE_KEY = '_snapshot_index'
+
+
+def _quote(name):
+    return '`%s`' % name.replace('`', '``')
+
+
+def encode(snapshot):
+    text = json.dumps(snapshot, separators=(',', ':'))
+    payload = zlib.compress(text.encode('utf-8'), 6)
+    return MAGIC + bytearray([FORMAT_VERSION]) + payload
+
+
+def decode(data):
+    if not data.startswith(MAGIC):
+        raise ValueError('not a graph snapshot')
+    version = bytearray(data[len(MAGIC):len(MAGIC) + 1])[0]
+    if version != FORMAT_VERSION:
+        raise ValueError('unsupported snapshot format version %d' % version)
+    snapshot = json.loads(zlib.decompress(data[len(MAGIC) + 1:]).decode('utf-8'))
+    # json has no tuples, restore them so snapshots compare equal to what was dumped
+    return {
+        'label_sets': [tuple(_) for _ in snapshot['label_sets']],
+        'types': snapshot['types'],
+        'nodes': [tuple(_) for _ in snapshot['nodes']],
+        'relationships': [tuple(_) for _ in snapshot['relationships']],
+    }
+
+
+class GraphSnapshot(object):
+    '''read the graph page by page into the compact snapshot structure'''
+
+    def __init__(self, graph, batch_size=10000):
+        self.graph = graph
+        self.batch_size = batch_size
+        # a namespace label is reapplied on restore rather than stored
+        self.namespace = getattr(graph, 'namespace', None)
+        self.label_sets = []
+        self.types = []
+        self.nodes = []
+        self.relationships = []
+        self._label_set_index = {}
+        self._type_index = {}
+        self._node_index = {}
+
+    def _index(self, lookup, values, key):
+        if key not in lookup:
+            lookup[key] = len(values)
+            values.append(key)
+        return lookup[key]
+
+    def read_nodes(self):
+        after = -1
+        while True:
+            cursor = self.graph.run((
+                "MATCH (n) WHERE id(n) > $after "
+                "RETURN id(n) AS id, labels(n) AS labels, properties(n) AS props "
+                "ORDER BY id(n) LIMIT $limit"
+            ), {'after': after, 'limit': self.batch_size})
+            rows = 0
+            for result in cursor:
+                label_set = tuple(sorted(
+                    label for label in result['labels'] if label != self.namespace))
+                label_index = self._index(self._label_set_index, self.label_sets, label_set)
+                self._node_index[result['id']] = len(self.nodes)
+                self.nodes.append((label_index, dict(result['props'])))
+                after = result['id']
+                rows += 1
+            if rows < self.batch_size:
+                return self.nodes
+
+    def read_relationships(self):
+        after = -1
+        while True:
+            cursor = self.graph.run((
+                "MATCH (a)-[r]->(b) WHERE id(r) > $after "
+                "RETURN id(r) AS id, id(a) AS start, type(r) AS type, id(b) AS end, "
+                "properties(r) AS props "
+                "ORDER BY id(r) LIMIT $limit"
+            ), {'after': after, 'limit': self.batch_size})
+            rows = 0
+            for result in cursor:
+                type_index = self._index(self._type_index, self.types, result['type'])
+                self.relationships.append((
+                    type_index,
+                    self._node_index[result['start']],
+                    self._node_index[result['end']],
+                    dict(result['props'])))
+                after = result['id']
+                rows += 1
+            if rows < self.batch_size:
+                return self.relationships
+
+    def read(self):
+        self.read_nodes()
+        self.read_relationships()
+        return {
+            'label_sets': self.label_sets,
+            'types': self.types,
+            'nodes': self.nodes,
+            'relationships': self.relationships,
+        }
+
+
+def dump(graph, path, batch_size=10000):
+    '''write a snapshot of the whole graph to path'''
+    snapshot = GraphSnapshot(graph, batch_size).read()
+    with open(path, 'wb') as f:
+        f.write(encode(snapshot))
+    return {
+        'nodes': len(snapshot['nodes']),
+        'relationships': len(snapshot['relationships']),
+    }
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return decode(f.read())
+
+
+def _batches(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
+def _grouped(rows, key):
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[key], []).append(row)
+    return sorted(groups.items())
+
+
+def restore(graph, path, batch_size=1000):
+    '''bulk load a snapshot into the graph with batched UNWIND writes'''
+    snapshot = load(path)
+
+    graph.run("CREATE INDEX ON :%s(%s)" % (RESTORE_LABEL, RESTORE_KEY))
+
+    nodes = [(label_index, index, props)
+             for index, (label_index, props) in enumerate(snapshot['nodes'])]
+    for label_index, rows in _grouped(nodes, 0):
+        labels = ''.join(':' + _quote(label) for label in snapshot['label_sets'][label_index])
+        for batch in _batches(rows, batch_size):
+            graph.run((
+                "UNWIND $rows AS row "
+                "CREATE (n:%s%s) "
+                "SET n = row.props, n.%s = row.index" % (RESTORE_LABEL, labels, RESTORE_KEY)
+            ), {'rows': [{'index': index, 'props': props} for _, index, props in batch]})
+
+    for type_index, rows in _grouped(snapshot['relationships'], 0):
+        rel_type = _quote(snapshot['types'][type_index])
+        for batch in _batches(rows, batch_size):
+            graph.run((
+                "UNWIND $rows AS row "
+                "MATCH (a:%s {%s: row.start}), (b:%s {%s: row.end}) "
+                "CREATE (a)-[r:%s]->(b) "
+                "SET r = row.props" % (
+                    RESTORE_LABEL, RESTORE_KEY, RESTORE_LABEL, RESTORE_KEY, rel_type)
+            ), {'rows': [{'start': start, 'end': end, 'props': props}
+                         for _, start, end, props in batch]})
+
+    while graph.run((
+        "MATCH (n:%s) WITH n LIMIT $limit "
+        "REMOVE n:%s, n.%s "
+        "RETURN count(n) AS cleaned" % (RESTORE_LABEL, RESTORE_LABEL, RESTORE_KEY)
+    ), {'limit': batch_size}).evaluate():
+        pass
+
+    graph.run("DROP INDEX ON :%s(%s)" % (RESTORE_LABEL, RESTORE_KEY))
+
+    return {
+        'nodes': len(snapshot['nodes']),
+        'relationships': len(snapshot['relationships']),
+    }
@@ -0,0 +1,69 @@
+'''time how long the app takes to start
+
+each stage is timed in a fresh interpreter so modules already imported
+by the caller don't hide their cost:
+
+    python startup.py [--connect]
+'''
+import json
+import os
+import subprocess
+import sys
+import time
+
+# the modules on the app's import path, in the order the factory pulls them in
+MODULES = ('flask', 'flask_bootstrap', 'flask_py2neo', 'extensions', 'models', 'views', 'commands', 'factory')
+
+
+def _measure(connect=False):
+    stages = []
+    start = last = time.time()
+
+    def mark(stage):
+        now = time.time()
+        stages.append((stage, now - last))
+        return now
+
+    for module in MODULES:
+        __import__(module)
+        last = mark('import %s' % module)
+
+    from factory import create_app
+    app = create_app()
+    last = mark('create_app')
+
+    if connect:
+        from extensions import db
+        with app.app_context():
+            db.graph.run("RETURN 1").evaluate()
+        last = mark('first graph query')
+
+    stages.append(('total', time.time() - start))
+    stages.append(('modules loaded', len(sys.modules)))
+    return stages
+
+
+def profile(connect=False):
+    '''[(stage, seconds)] measured in a new interpreter'''
+    script = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+    args = [sys.executable, script, '--json'] + (['--connect'] if connect else [])
+    output = subprocess.check_output(args)
+    return [tuple(_) for _ in json.loads(output.decode('utf-8'))]
+
+
+def report(stages):
+    lines = []
+    for stage, value in stages:
+        if isinstance(value, float):
+            lines.append('%-28s %8.1f ms' % (stage, value * 1000))
+        else:
+            lines.append('%-28s %8d' % (stage, value))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    stages = _measure(connect='--connect' in sys.argv)
+    if '--json' in sys.argv:
+        sys.stdout.write(json.dumps(stages))
+    else:
+        print(report(stages))
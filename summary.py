@@ -0,0 +1,134 @@
+'''the materialized compliance summary
+
+rather than joining every client to its onboard, the compliance view
+reads one ComplianceSummary node: a row per client kept as parallel
+arrays sorted by company name, plus the counts of complete, incomplete
+and invalid onboards. writes that change an onboard refresh the rows of
+just those clients; rebuild recomputes the whole summary from the graph
+'''
+import time
+
+# fields of a row, stored as one array each on the summary node
+FIELDS = ('company_id', 'company_name', 'completed', 'valid_onboard', 'missing_documents')
+ARRAYS = ('company_ids', 'company_names', 'completed', 'valid', 'missing_documents')
+COUNTS = ('clients', 'complete', 'incomplete', 'invalid')
+
+ROWS = (
+    "MATCH (c:Client)-[:HAS_ONBOARD]->(o) "
+    "WHERE $company_ids IS NULL OR c.company_id IN $company_ids "
+    "RETURN c.company_id AS company_id, c.company_name AS company_name, "
+    "o.completed AS completed, o.valid_onboard AS valid_onboard, "
+    "o.required_documents AS required, o.submitted_documents AS submitted"
+)
+
+# serializes updates until commit, see graphdb.transaction
+LOCK = (
+    "MERGE (s:ComplianceSummary {name: 'compliance'}) "
+    "SET s._lock = true "
+    "RETURN " + ', '.join('s.%s AS %s' % (_, _) for _ in ARRAYS) + ", "
+    "s.updated_at IS NOT NULL AS built"
+)
+
+READ = (
+    "MATCH (s:ComplianceSummary {name: 'compliance'}) "
+    "RETURN " + ', '.join('s.%s AS %s' % (_, _) for _ in ARRAYS + COUNTS)
+)
+
+SAVE = (
+    "MATCH (s:ComplianceSummary {name: 'compliance'}) "
+    "SET " + ', '.join('s.%s = $%s' % (_, _) for _ in ARRAYS + COUNTS) + ", s.updated_at = $now "
+    "REMOVE s._lock"
+)
+
+
+def row(result):
+    '''a summary row from a client and its onboard'''
+    missing = (result['required'] or 0) & ~(result['submitted'] or 0)
+    return (result['company_id'], result['company_name'] or '', bool(result['completed']),
+            result['valid_onboard'] is not False, bin(missing).count('1'))
+
+
+def _sort_key(row):
+    return row[1], row[0]
+
+
+def from_arrays(arrays):
+    '''rows from the summary node's arrays'''
+    return list(zip(*[arrays[_] or [] for _ in ARRAYS]))
+
+
+def to_arrays(rows):
+    '''the summary node's arrays and counts from rows'''
+    values = dict((name, [_[index] for _ in rows]) for index, name in enumerate(ARRAYS))
+    complete = sum(1 for _ in rows if _[2])
+    values.update({
+        'clients': len(rows),
+        'complete': complete,
+        'incomplete': len(rows) - complete,
+        'invalid': sum(1 for _ in rows if not _[3])})
+    return values
+
+
+def merge(rows, refreshed, company_ids):
+    '''rows with those of company_ids replaced by the refreshed ones, in order
+
+    a client in company_ids without a refreshed row is dropped
+    '''
+    company_ids = set(company_ids)
+    merged = [_ for _ in rows if _[0] not in company_ids]
+    merged.extend(refreshed)
+    return sorted(merged, key=_sort_key)
+
+
+def _fresh_rows(graph, company_ids=None):
+    return [row(_) for _ in graph.run(ROWS, {'company_ids': company_ids})]
+
+
+def _save(graph, rows, now):
+    values = to_arrays(rows)
+    values['now'] = int(time.time()) if now is None else now
+    graph.run(SAVE, values)
+    return values
+
+
+def update(tx, company_ids, now=None):
+    '''refresh the rows of some clients
+
+    run it in the transaction of the write, which holds the summary's
+    lock until commit. a summary that was never built is built in full
+    rather than started with just these clients.
+
+    every update reads and rewrites all rows under the lock, so writes
+    that touch the summary cost O(clients) and run one at a time; past
+    a few tens of thousands of clients keep a node per row instead
+    '''
+    company_ids = list(company_ids)
+    locked = tx.run(LOCK).next()
+    if not locked['built']:
+        return _save(tx, sorted(_fresh_rows(tx), key=_sort_key), now)
+    rows = merge(from_arrays(locked), _fresh_rows(tx, company_ids), company_ids)
+    return _save(tx, rows, now)
+
+
+def rebuild(tx, now=None):
+    '''recompute the summary from every client, in a transaction
+
+    returns the counts, and in changed the number of rows that were
+    missing, stale or left over in the stored summary
+    '''
+    current = set(from_arrays(tx.run(LOCK).next()))
+    rows = sorted(_fresh_rows(tx), key=_sort_key)
+    counts = dict((_, value) for _, value in _save(tx, rows, now).items() if _ in COUNTS)
+    counts['changed'] = len(current.symmetric_difference(rows))
+    return counts
+
+
+def read(graph):
+    '''the summary rows and counts, None until the summary is first built'''
+    cursor = graph.run(READ)
+    if not cursor.forward():
+        return None
+    result = cursor.current()
+    return {
+        'rows': from_arrays(result),
+        'counts': dict((_, result[_] or 0) for _ in COUNTS)}
@@ -1,12 +1,18 @@
+import os
+
 import pytest
 from factory import create_app
 from extensions import db as _db
+from wipe import wipe_graph
 
 
 TEST_DB_URI = 'testdb'
 TEST_DB_HTTP = 7475
 TEST_DB_BOLT = 7688
 
+# under pytest-xdist each worker gets its own namespace in the test db
+TEST_NAMESPACE = os.environ.get('PYTEST_XDIST_WORKER')
+
 
 @pytest.fixture(scope='session')
 def app():
@@ -16,7 +22,9 @@ def app():
         'PY2NEO_BOLT': None, # without this, creating a relationship off the OGM threw an error
         'PY2NEO_HOST': TEST_DB_URI,
         'PY2NEO_HTTP_PORT': TEST_DB_HTTP,
-        'PY2NEO_BOLT_PORT': TEST_DB_BOLT
+        'PY2NEO_BOLT_PORT': TEST_DB_BOLT,
+        'SHARED_CACHE_ENABLED': False,
+        'GRAPH_NAMESPACE': 'Test_%s' % TEST_NAMESPACE if TEST_NAMESPACE else None
     })
     with _app.app_context():
 
@@ -29,7 +37,7 @@ def db(app):
     assert app.config['PY2NEO_HOST'] == TEST_DB_URI
     assert TEST_DB_URI + ':' + str(TEST_DB_HTTP) in _db.graph.transaction_uri
 
-    _db.graph.run("MATCH (n) DETACH DELETE n")
+    wipe_graph(_db.graph)
 
     cursor = _db.graph.run("MATCH (n) RETURN n")
     assert not cursor.forward()
@@ -37,6 +45,13 @@ def db(app):
     yield _db
 
 
+@pytest.fixture
+def rollback(db):
+    '''run a test inside one graph transaction that is rolled back afterwards'''
+    with db.rollback_scope():
+        yield db
+
+
 @pytest.fixture(scope='session')
 def client(app):
 
@@ -0,0 +1,181 @@
+import os
+import time
+
+from cache import SharedCache
+
+
+class TestSharedCache(object):
+
+    def test_disabled_without_path(self):
+
+        cache = SharedCache()
+
+        assert not cache.enabled
+        assert cache.get('key', 'default') == 'default'
+        assert cache.set('key', 'value') == 'value'
+        assert cache.get('key') is None
+
+    def test_set_and_get(self, tmpdir):
+
+        cache = SharedCache(str(tmpdir))
+        cache.set('key', {'a': [1, 2, 3]})
+
+        assert cache.get('key') == {'a': [1, 2, 3]}
+
+    def test_entries_are_shared_between_instances(self, tmpdir):
+
+        worker_1 = SharedCache(str(tmpdir))
+        worker_2 = SharedCache(str(tmpdir))
+
+        worker_1.set('key', 'value')
+
+        assert worker_2.get('key') == 'value'
+
+    def test_expired_entry_is_a_miss(self, tmpdir):
+
+        cache = SharedCache(str(tmpdir))
+        cache.set('key', 'value', ttl=-1)
+
+        assert cache.get('key') is None
+
+    def test_invalidate_bumps_version_for_every_worker(self, tmpdir):
+
+        worker_1 = SharedCache(str(tmpdir))
+        worker_2 = SharedCache(str(tmpdir))
+
+        worker_1.set('key', 'value')
+        version = worker_2.invalidate()
+
+        assert version == 1
+        assert worker_1.version() == 1
+        assert worker_1.get('key') is None
+
+    def test_eviction_keeps_total_size_under_max_bytes(self, tmpdir):
+
+        cache = SharedCache(str(tmpdir), max_bytes=1024)
+
+        for i in range(10):
+            cache.set('key-%d' % i, 'x' * 256)
+
+        total = sum(size for _, size, _ in cache._entries())
+
+        assert total <= 1024
+        assert cache.get('key-9') == 'x' * 256
+        assert cache.get('key-0') is None
+
+    def test_memoize_caches_none(self, tmpdir):
+
+        cache = SharedCache(str(tmpdir))
+        calls = []
+
+        @cache.memoize('nothing')
+        def nothing():
+            calls.append(1)
+            return None
+
+        assert nothing() is None
+        assert nothing() is None
+        assert len(calls) == 1
+
+    def test_memoize_keys_on_arguments(self, tmpdir):
+
+        cache = SharedCache(str(tmpdir))
+        calls = []
+
+        @cache.memoize('double')
+        def double(x):
+            calls.append(x)
+            return x * 2
+
+        assert double(2) == 4
+        assert double(2) == 4
+        assert double(3) == 6
+        assert calls == [2, 3]
+
+    def test_memoize_recomputes_after_invalidate(self, tmpdir):
+
+        cache = SharedCache(str(tmpdir))
+        calls = []
+
+        @cache.memoize('count')
+        def count():
+            calls.append(1)
+            return len(calls)
+
+        assert count() == 1
+        cache.invalidate()
+        assert count() == 2
+
+    def test_invalidate_by_name_keeps_other_results(self, tmpdir):
+
+        cache = SharedCache(str(tmpdir))
+        calls = []
+
+        @cache.memoize('first')
+        def first():
+            calls.append('first')
+
+        @cache.memoize('second')
+        def second():
+            calls.append('second')
+
+        first()
+        second()
+        cache.invalidate('first')
+        first()
+        second()
+
+        assert calls == ['first', 'second', 'first']
+
+    def test_result_computed_across_invalidate_is_not_served(self, tmpdir):
+
+        cache = SharedCache(str(tmpdir))
+        calls = []
+
+        @cache.memoize('racy')
+        def racy():
+            calls.append(1)
+            if len(calls) == 1:
+                # a write lands while the first call is computing
+                cache.invalidate('racy')
+            return len(calls)
+
+        assert racy() == 1
+        assert racy() == 2
+        assert racy() == 2
+
+    def test_bypass_skips_the_cache(self, tmpdir):
+
+        wrote = [False]
+        cache = SharedCache(str(tmpdir), bypass=lambda: wrote[0])
+        calls = []
+
+        @cache.memoize('summary')
+        def summary():
+            calls.append(1)
+            return len(calls)
+
+        assert summary() == 1
+        wrote[0] = True
+        assert summary() == 2
+        assert summary() == 3
+        wrote[0] = False
+        assert summary() == 1
+
+    def test_scope_separates_results(self, tmpdir):
+
+        scope = ['a']
+        cache = SharedCache(str(tmpdir), scope=lambda: scope[0])
+        calls = []
+
+        @cache.memoize('summary')
+        def summary():
+            calls.append(scope[0])
+            return scope[0]
+
+        assert summary() == 'a'
+        scope[0] = 'b'
+        assert summary() == 'b'
+        scope[0] = 'a'
+        assert summary() == 'a'
+        assert calls == ['a', 'b']
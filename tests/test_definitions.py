@@ -0,0 +1,148 @@
+import json
+
+import pytest
+
+from definitions import CompiledProcess, ProcessRegistry, DEFAULT_PATH, topological_order
+
+
+def definition(version=1, tasks=None, documents=None):
+    return {
+        'version': version,
+        'tasks': tasks if tasks is not None else [
+            {'task_name': 'a', 'duration': 1},
+            {'task_name': 'b', 'duration': 2, 'depends_on': [0]},
+            {'task_name': 'c', 'duration': 3, 'depends_on': [1]},
+        ],
+        'documents': documents if documents is not None else [
+            {'type': 'contract', 'for_step': 0},
+            {'type': 'license', 'for_step': 2},
+        ],
+    }
+
+
+class TestTopologicalOrder(object):
+
+    def test_dependencies_come_first(self):
+
+        order = topological_order([
+            {'task_name': 'a', 'depends_on': [2]},
+            {'task_name': 'b'},
+            {'task_name': 'c', 'depends_on': [1]},
+        ])
+
+        assert order == [1, 2, 0]
+
+    def test_cycle(self):
+
+        with pytest.raises(ValueError) as exc_info:
+            topological_order([
+                {'task_name': 'a', 'depends_on': [1]},
+                {'task_name': 'b', 'depends_on': [0]},
+                {'task_name': 'c'},
+            ])
+
+        assert exc_info.match('steps \\[0, 1\\] form a dependency cycle')
+
+    def test_unknown_dependency(self):
+
+        with pytest.raises(ValueError) as exc_info:
+            topological_order([{'task_name': 'a', 'depends_on': [5]}])
+
+        assert exc_info.match('unknown step 5')
+
+
+class TestCompiledProcess(object):
+
+    def test_masks(self):
+
+        process = CompiledProcess(definition())
+
+        assert process.dependency_masks == [0, 0b1, 0b11]
+        assert process.step_mask == 0b111
+        assert process.required_documents == 0b11
+        assert process.dependency_mask(2) == 0b11
+        assert process.dependency_mask(40) == 0
+
+    def test_documents_by_id(self):
+
+        process = CompiledProcess(definition())
+
+        assert process.documents_by_id[1] == {
+            'document_id': 1, 'document_type': 'license', 'step_number': 2}
+
+    def test_document_for_unknown_step(self):
+
+        with pytest.raises(ValueError) as exc_info:
+            CompiledProcess(definition(documents=[{'type': 'x', 'for_step': 3}]))
+
+        assert exc_info.match('process version 1: document 0 is for unknown step 3')
+
+    def test_version_must_be_an_integer(self):
+
+        with pytest.raises(ValueError):
+            CompiledProcess(definition(version='1'))
+
+    def test_too_many_tasks(self):
+
+        tasks = [{'task_name': 'task %d' % _} for _ in range(64)]
+
+        with pytest.raises(ValueError):
+            CompiledProcess(definition(tasks=tasks, documents=[]))
+
+    def test_task_without_a_duration(self):
+
+        with pytest.raises(ValueError) as exc_info:
+            CompiledProcess(definition(tasks=[{'task_name': 'a'}], documents=[]))
+
+        assert exc_info.match('process version 1: step 0 needs a duration in days, got None')
+
+    def test_document_without_a_type(self):
+
+        with pytest.raises(ValueError) as exc_info:
+            CompiledProcess(definition(documents=[{'for_step': 0}]))
+
+        assert exc_info.match('process version 1: document 0 has no type')
+
+    def test_checksum(self):
+
+        process = CompiledProcess(definition())
+        changed = definition()
+        changed['tasks'][0]['duration'] = 5
+
+        assert process.checksum == CompiledProcess(definition()).checksum
+        assert process.checksum != CompiledProcess(changed).checksum
+
+
+class TestProcessRegistry(object):
+
+    def test_default_definitions(self):
+
+        registry = ProcessRegistry()
+        registry.load(DEFAULT_PATH)
+
+        assert registry.versions() == [1]
+        assert len(registry.latest.tasks) == 5
+        assert len(registry.latest.documents) == 9
+
+    def test_versions(self, tmpdir):
+
+        path = tmpdir.join('processes.json')
+        path.write(json.dumps({'processes': [definition(1), definition(2, documents=[])]}))
+
+        registry = ProcessRegistry()
+        registry.load(str(path))
+
+        assert registry.get().version == 2
+        assert registry.get(1).required_documents == 0b11
+        assert registry.find(None) is None
+        assert registry.find(3) is None
+        with pytest.raises(LookupError):
+            registry.get(3)
+
+    def test_duplicate_versions(self, tmpdir):
+
+        path = tmpdir.join('processes.json')
+        path.write(json.dumps({'processes': [definition(1), definition(1)]}))
+
+        with pytest.raises(ValueError):
+            ProcessRegistry().load(str(path))
@@ -0,0 +1,60 @@
+import eta
+from definitions import CompiledProcess
+
+
+PROCESS = CompiledProcess({
+    'version': 1,
+    'tasks': [
+        {'task_name': 'get signed contracts', 'duration': 3},
+        {'task_name': 'get compliance documents', 'duration': 4},
+        {'task_name': 'compliance review', 'duration': 3},
+        {'task_name': 'countersign contracts', 'duration': 5, 'depends_on': [0, 1, 2]},
+        {'task_name': 'account activation', 'duration': 3, 'depends_on': [3]},
+    ],
+})
+
+
+class TestCriticalPath(object):
+
+    def test_longest_chain(self):
+
+        path = eta.critical_path(PROCESS)
+
+        assert path == {'steps': [1, 3, 4], 'duration': 12}
+
+
+class TestExpectedCompletions(object):
+
+    def test_completed_matrix(self):
+
+        completed = eta.completed_matrix(PROCESS, [0, 0b10011, None])
+
+        assert completed.tolist() == [
+            [False, False, False, False, False],
+            [True, True, False, False, True],
+            [False, False, False, False, False]]
+
+    def test_remaining_days(self):
+
+        remaining = eta.remaining_days(PROCESS, [0, 0b00010, 0b01111, 0b11111])
+
+        # nothing done, step 1 done so steps 0/2 now lead, only step 4 left, all done
+        assert remaining.tolist() == [12, 11, 3, 0]
+
+    def test_expected_completions(self):
+
+        expected = eta.expected_completions(PROCESS, [0b01111], 1000)
+
+        assert expected.tolist() == [1000 + 3 * eta.DAY]
+
+    def test_expected_completions_count_elapsed_days(self):
+
+        now = 1000 + 5 * eta.DAY
+        expected = eta.expected_completions(PROCESS, [0, 0b01111, 0], now, [1000, 1000, None])
+
+        # 5 of 12 days spent, 3 days left but 5 spent so overdue, nothing recorded
+        assert expected.tolist() == [1000 + 12 * eta.DAY, now, now + 12 * eta.DAY]
+
+    def test_no_onboards(self):
+
+        assert eta.expected_completions(PROCESS, [], 1000).tolist() == []
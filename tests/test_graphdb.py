@@ -0,0 +1,241 @@
+import time
+
+import pytest
+from mock import patch
+
+from extensions import db as _db
+from graphdb import namespace_statement, NamespacedGraph, PrimaryGraph, ReplicaGraph
+from models import Client, BuildClientOnboard, BuildGenericProcess, BuildOnboardGenericProcess
+from models import BuildOnboardActivity, BuildAction, Onboard
+
+
+class TestNamespaceStatement(object):
+
+    NAMESPACE = 'Test_gw0'
+
+    def test_unlabelled_node(self):
+
+        statement = namespace_statement("match (n) detach delete n", self.NAMESPACE)
+
+        assert statement == "match (n:`Test_gw0`) detach delete n"
+
+    def test_labelled_and_anonymous_nodes(self):
+
+        statement = namespace_statement((
+            "match (:Client {company_id: 'cid'})-[:HAS_ONBOARD]->()-[:HAS_ACTIVITY]->(a) "
+            "return a"
+        ), self.NAMESPACE)
+
+        assert statement == (
+            "match (:Client:`Test_gw0` {company_id: 'cid'})-[:HAS_ONBOARD]->(:`Test_gw0`)"
+            "-[:HAS_ACTIVITY]->(a:`Test_gw0`) "
+            "return a"
+        )
+
+    def test_bound_variables_are_not_relabelled(self):
+
+        statement = namespace_statement((
+            "match (p:Project)-[:FOR_CLIENT]->(c:Client) "
+            "match (c)-[:HAS_ONBOARD]->()-[:MUST_FOLLOW]->()-[:HAS_STEP]->(s) "
+            "merge (p)-[:ACCESSED_STEP]->(s)"
+        ), self.NAMESPACE)
+
+        assert "merge (p)-[:ACCESSED_STEP]->(s)" in statement
+        assert "match (c)-[:HAS_ONBOARD]" in statement
+
+    def test_alias_bound_variables_are_not_relabelled(self):
+
+        statement = namespace_statement((
+            "match (o:Onboard) optional match (p:GenericStep) "
+            "with o, coalesce(p, o) AS s limit 1 "
+            "unwind [1] AS i "
+            "merge (o)-[:HAS_COMPLETED]->(s)"
+        ), self.NAMESPACE)
+
+        assert statement.endswith("merge (o)-[:HAS_COMPLETED]->(s)")
+        assert "(p:GenericStep:`Test_gw0`)" in statement
+
+    def test_string_literals_are_left_alone(self):
+
+        statement = namespace_statement((
+            "match (c:Client {company_name: 'acme (holdings)'}) "
+            "where c.note <> \"(n)\" "
+            "return '(x) and (y:Label)' AS text"
+        ), self.NAMESPACE)
+
+        assert statement == (
+            "match (c:Client:`Test_gw0` {company_name: 'acme (holdings)'}) "
+            "where c.note <> \"(n)\" "
+            "return '(x) and (y:Label)' AS text"
+        )
+
+    def test_function_calls_are_left_alone(self):
+
+        statement = namespace_statement((
+            "match (s:GenericStep)-[:DEPENDS_ON*]->(ds) "
+            "where id(s) > 0 and 'Crm' in labels(s) "
+            "return count(ds) AS num_depends"
+        ), self.NAMESPACE)
+
+        assert "id(s) > 0" in statement
+        assert "labels(s)" in statement
+        assert "count(ds)" in statement
+
+
+class TestNamespacedGraph(object):
+
+    @classmethod
+    def teardown_class(cls):
+        _db.graph.run("match (c:Client) detach delete c")
+
+    def test_namespaces_are_isolated(self, db):
+
+        BuildClientOnboard('namespaced-cid', 'namespaced-cname').init_rels()
+
+        graph = db.graph
+        namespace = getattr(graph, 'namespace', None) or 'Test_default'
+        other = NamespacedGraph(getattr(graph, '_target', graph), namespace + '_other')
+
+        assert Client.select(db.graph).where(company_id='namespaced-cid').first() is not None
+        assert Client.select(other).where(company_id='namespaced-cid').first() is None
+
+    def test_step_completion_stays_in_its_namespace(self, app, db, monkeypatch):
+
+        namespace = (app.config['GRAPH_NAMESPACE'] or 'Test_default') + '_aware'
+        monkeypatch.setitem(app.config, 'GRAPH_NAMESPACE', namespace)
+        try:
+            BuildGenericProcess().init()
+            BuildClientOnboard('aware-cid', 'aware-cname').init()
+            BuildOnboardGenericProcess('aware-cid').init()
+            BuildOnboardActivity('aware-cid').init()
+
+            state = BuildAction('aware-cid').aware_mark_step_complete(0)
+
+            assert state['satisfied']
+            assert state['completed_steps'] == Onboard.step_bit(0)
+
+            cursor = db.graph.run((
+                "match (o:Onboard)-[:HAS_COMPLETED]->(s) "
+                "return s.step_number AS step_number, '%s' in labels(s) AS namespaced" % namespace
+            ))
+
+            assert cursor.forward() == 1
+            assert cursor.current()['step_number'] == 0
+            assert cursor.current()['namespaced']
+            assert cursor.forward() == 0
+        finally:
+            db.graph.run("match (n) detach delete n")
+
+
+class TestRollbackScope(object):
+
+    def test_writes_are_visible_inside_and_rolled_back_after(self, db):
+
+        with db.rollback_scope():
+            BuildClientOnboard('rollback-cid', 'rollback-cname').init_rels()
+
+            client = Client.select(db.graph).where(company_id='rollback-cid').first()
+
+            assert client is not None
+            assert len(list(client.has_onboard)) == 1
+
+        cursor = db.graph.run((
+            "match (c:Client {company_id: 'rollback-cid'}) "
+            "return c"
+        ))
+
+        assert cursor.forward() == 0
+
+
+class FakeGraph(object):
+
+    def run(self, statement, parameters=None, **kwparameters):
+        return statement
+
+    def push(self, subgraph):
+        return subgraph
+
+
+class TestReadRouting(object):
+
+    def test_reads_do_not_mark_the_request_as_written(self, app):
+
+        with app.app_context(), app.test_request_context():
+            from flask import g
+            graph = PrimaryGraph(FakeGraph())
+            graph.run("MATCH (c:Client) RETURN c.company_id")
+
+            assert not getattr(g, 'graph_written', False)
+
+    def test_writes_mark_the_request_as_written(self, app):
+
+        with app.app_context(), app.test_request_context():
+            from flask import g
+            PrimaryGraph(FakeGraph()).run("MATCH (o:Onboard) SET o.completed = true")
+
+            assert g.graph_written
+
+        with app.app_context(), app.test_request_context():
+            from flask import g
+            PrimaryGraph(FakeGraph()).push(object())
+
+            assert g.graph_written
+
+    def test_read_graph_is_the_primary_without_replicas(self, db):
+
+        assert db.read_graph.run("RETURN 1").evaluate() == 1
+
+
+class TestResetConnections(object):
+
+    def test_cached_graphs_are_forgotten(self, db):
+
+        from py2neo import database
+        db.graph.run("RETURN 1").evaluate()
+
+        db.reset_connections()
+
+        assert not database.Graph._Graph__instances
+
+    def test_missing_py2neo_caches_only_warn(self, db):
+
+        from py2neo import database
+        with patch.object(database.Graph, '_Graph__instances', None):
+            with pytest.warns(UserWarning):
+                db.reset_connections()
+
+
+class DownGraph(object):
+
+    def run(self, statement, parameters=None, **kwparameters):
+        raise IOError('connection refused')
+
+
+class TestReplicaGraph(object):
+
+    def test_unreachable_replica_falls_back_to_the_primary(self):
+
+        failures = []
+        graph = ReplicaGraph(DownGraph(), FakeGraph(), lambda: failures.append(1))
+
+        assert graph.run("MATCH (c:Client) RETURN c") == "MATCH (c:Client) RETURN c"
+        assert failures == [1]
+
+    def test_database_errors_are_raised(self):
+
+        from py2neo.database.status import GraphError
+
+        class FailingGraph(object):
+            def run(self, statement, parameters=None, **kwparameters):
+                raise GraphError('bad statement')
+
+        with pytest.raises(GraphError):
+            ReplicaGraph(FailingGraph(), FakeGraph()).run("MATCH (")
+
+    def test_replicas_marked_down_are_skipped(self, app, db, monkeypatch):
+
+        monkeypatch.setitem(app.config, 'GRAPH_READ_REPLICAS', ['replica-host'])
+        monkeypatch.setattr(db, '_replica_down', {'replica-host': time.time() + 60})
+
+        with app.test_request_context():
+            assert db.read_graph.run("RETURN 1").evaluate() == 1
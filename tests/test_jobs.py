@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+
+import pytest
+
+from jobs import JobConflict, JobRunner, FINISHED, FAILED, INTERRUPTED, QUEUED, RUNNING
+
+
+class TestJobRunner(object):
+
+    def runner(self, app, tmpdir):
+        runner = JobRunner(str(tmpdir), workers=1)
+        runner.app = app
+        return runner
+
+    def test_job_runs_and_records_result(self, app, tmpdir):
+
+        runner = self.runner(app, tmpdir)
+
+        def job(x, progress):
+            progress('halfway')
+            return x * 2
+
+        job_id = runner.submit('double', job, 21)
+        runner.join()
+
+        state = runner.get(job_id)
+
+        assert state['status'] == FINISHED
+        assert state['name'] == 'double'
+        assert state['progress'] == 'halfway'
+        assert state['result'] == 42
+        assert state['duration'] >= 0
+
+    def test_failed_job_records_error(self, app, tmpdir):
+
+        runner = self.runner(app, tmpdir)
+
+        def job(progress):
+            raise LookupError('required graph structure missing')
+
+        job_id = runner.submit('fail', job)
+        runner.join()
+
+        state = runner.get(job_id)
+
+        assert state['status'] == FAILED
+        assert state['error'] == 'LookupError: required graph structure missing'
+
+    def test_state_survives_a_restart(self, app, tmpdir):
+
+        runner = self.runner(app, tmpdir)
+        job_id = runner._save({
+            'id': 'left-behind',
+            'name': 'build',
+            'status': QUEUED,
+            'pid': os.getpid(), # a reused pid doesn't keep it alive
+            'created_at': 0,
+            'heartbeat_at': 0,
+        })['id']
+
+        restarted = self.runner(app, tmpdir)
+
+        assert restarted.recover() == [job_id]
+        assert restarted.get(job_id)['status'] == INTERRUPTED
+        assert [job['id'] for job in restarted.all()] == [job_id]
+
+    def test_unknown_job(self, app, tmpdir):
+
+        assert self.runner(app, tmpdir).get('no-such-job') is None
+
+    def test_jobs_are_recovered_on_first_use(self, app, tmpdir):
+
+        runner = self.runner(app, tmpdir)
+        job_id = runner._save({
+            'id': 'left-behind',
+            'name': 'build',
+            'status': QUEUED,
+            'pid': os.getpid(),
+            'created_at': 0,
+            'heartbeat_at': 0,
+        })['id']
+
+        restarted = self.runner(app, tmpdir)
+
+        assert not restarted._recovered
+        assert restarted.get(job_id)['status'] == INTERRUPTED
+
+    def test_a_renewed_job_is_not_interrupted(self, app, tmpdir):
+
+        runner = self.runner(app, tmpdir)
+        job_id = runner._save({
+            'id': 'elsewhere',
+            'name': 'build',
+            'status': RUNNING,
+            'pid': 1,
+            'created_at': 0,
+            'heartbeat_at': time.time(),
+        })['id']
+
+        assert self.runner(app, tmpdir).get(job_id)['status'] == RUNNING
+
+    def test_exclusive_jobs_are_rejected_while_one_runs(self, app, tmpdir):
+
+        runner = self.runner(app, tmpdir)
+        release = threading.Event()
+
+        def job(progress):
+            release.wait(5)
+
+        first = runner.submit_exclusive('graph', 'build', job)
+        with pytest.raises(JobConflict) as e:
+            self.runner(app, tmpdir).submit_exclusive('graph', 'create_clients', job)
+        assert e.value.job['id'] == first
+
+        release.set()
+        runner.join()
+
+        second = runner.submit_exclusive('graph', 'build', job)
+        runner.join()
+        assert runner.get(second)['status'] == FINISHED
@@ -0,0 +1,60 @@
+import json
+
+import matrix
+
+
+ROWS = [
+    ('employee_2', ['Erp', 'Crm', 'Erp']),
+    ('employee_1', ['Crm']),
+    ('employee_3', []),
+]
+
+
+class TestAccessMatrix(object):
+
+    def test_build(self):
+
+        access = matrix.build(ROWS)
+
+        assert access == {
+            'employees': ['employee_1', 'employee_2', 'employee_3'],
+            'applications': ['Crm', 'Erp'],
+            'indptr': [0, 1, 3, 3],
+            'indices': [0, 0, 1],
+        }
+        assert matrix.columns(access, 1) == [0, 1]
+        assert matrix.columns(access, 2) == []
+
+    def test_json_export(self):
+
+        exported = json.loads(''.join(matrix.iter_json(matrix.build(ROWS))))
+
+        assert exported['applications'] == ['Crm', 'Erp']
+        assert exported['employees'][1] == {'id': 'employee_2', 'applications': [0, 1]}
+        assert len(exported['employees']) == 3
+
+    def test_csv_export(self):
+
+        lines = ''.join(matrix.iter_csv(matrix.build(ROWS))).splitlines()
+
+        assert lines == [
+            'employee_id,application',
+            'employee_1,Crm',
+            'employee_2,Crm',
+            'employee_2,Erp']
+
+    def test_csv_export_of_non_ascii_names(self):
+
+        text = ''.join(matrix.iter_csv(matrix.build([(u'employ\xe9_1', [u'R\xe9seau'])])))
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+
+        assert text.splitlines() == [u'employee_id,application', u'employ\xe9_1,R\xe9seau']
+
+    def test_empty(self):
+
+        access = matrix.build([])
+
+        assert access['indptr'] == [0]
+        assert json.loads(''.join(matrix.iter_json(access))) == {
+            'applications': [], 'employees': []}
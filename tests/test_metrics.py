@@ -0,0 +1,75 @@
+from prometheus_client import REGISTRY
+
+from cache import SharedCache
+from graphdb import TimedGraph
+from metrics import time_query, count_cache_lookup
+
+
+def _sample(metric, **labels):
+    return REGISTRY.get_sample_value(metric, labels) or 0
+
+
+class FakeGraph(object):
+
+    def run(self, statement, parameters=None, **kwparameters):
+        return statement
+
+
+class TestQueryMetrics(object):
+
+    def test_time_query_observes_latency(self):
+
+        before = _sample('cypher_query_duration_seconds_count', query='test_query')
+        with time_query('test_query'):
+            assert _sample('cypher_queries_in_flight') >= 1
+
+        assert _sample('cypher_query_duration_seconds_count', query='test_query') == before + 1
+
+    def test_timed_graph_names_queries_after_the_caller(self):
+
+        graph = TimedGraph(FakeGraph(), time_query)
+        before = _sample('cypher_query_duration_seconds_count', query='list_clients')
+
+        def list_clients():
+            return graph.run("MATCH (c:Client) RETURN c")
+
+        assert list_clients() == "MATCH (c:Client) RETURN c"
+        assert _sample('cypher_query_duration_seconds_count', query='list_clients') == before + 1
+
+
+class TestCacheMetrics(object):
+
+    def test_memoize_reports_hits_and_misses(self, tmpdir):
+
+        cache = SharedCache(str(tmpdir))
+        cache.observers.append(count_cache_lookup)
+
+        @cache.memoize('metrics_double')
+        def double(x):
+            return x * 2
+
+        hits = _sample('cache_lookups_total', name='metrics_double', result='hit')
+        misses = _sample('cache_lookups_total', name='metrics_double', result='miss')
+
+        double(2)
+        double(2)
+        double(3)
+
+        assert _sample('cache_lookups_total', name='metrics_double', result='hit') == hits + 1
+        assert _sample('cache_lookups_total', name='metrics_double', result='miss') == misses + 2
+
+
+class TestMetricsEndpoint(object):
+
+    def test_requests_are_counted_by_route(self, app):
+
+        client = app.test_client()
+        before = _sample('http_requests_total', endpoint='bp.job_list', method='GET', status='200')
+
+        assert client.get('/jobs').status_code == 200
+        response = client.get('/metrics')
+
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        assert b'http_request_duration_seconds' in response.data
+        assert _sample('http_requests_total', endpoint='bp.job_list', method='GET', status='200') == before + 1
@@ -6,12 +6,15 @@
 import pytest
 from py2neo.types import Node
 import arrow 
+import numpy as np
 from mock import patch, MagicMock
 
 # _db used in class level teardown
 # bc using the db-fixture there does not work
 # https://docs.pytest.org/en/latest/xunit_setup.html#class-level-setup-teardown
 from extensions import db as _db
+from graphdb import transaction
+import summary
 
 # broken into multiple lines to try to organize similar logic
 # for the future this could be modularized further
@@ -85,20 +88,61 @@ class TestClient(object):
 
     def test_list_all_with_compliance_status(self):
 
+        # other tests delete clients directly, so bring the summary up to date first
+        with transaction(_db.graph) as tx:
+            summary.rebuild(tx)
+
         clients_with_compliance = Client.list_all_with_compliance_status()
 
         assert len(clients_with_compliance) == self.NUM_CLIENTS
         for result in clients_with_compliance:
-            assert result.get('client') is not None
-            assert result.get('completed') is not None
-            assert result.get('valid_onboard') is not None
+            assert result.company_id is not None
+            assert result.company_name is not None
+            assert result.completed is not None
+            assert result.valid_onboard is not None
+
+    def test_compliance_summary_is_maintained_on_write(self, rollback):
+
+        with transaction(rollback.graph) as tx:
+            summary.rebuild(tx)
+        before = Client.compliance_summary()['counts']
+
+        BuildClientOnboard('summary-cid', 'summary-cname').init()
+
+        compliance = Client.compliance_summary()
+        row = [_ for _ in compliance['rows'] if _[0] == 'summary-cid']
+
+        assert row == [('summary-cid', 'summary-cname', False, True, 0)]
+        assert compliance['counts']['clients'] == before['clients'] + 1
+        assert compliance['counts']['incomplete'] == before['incomplete'] + 1
+        assert [_[1] for _ in compliance['rows']] == sorted(_[1] for _ in compliance['rows'])
+
+    def test_first_write_builds_the_whole_summary(self, rollback):
+
+        rollback.graph.run("MATCH (s:ComplianceSummary) DETACH DELETE s")
+        clients = rollback.graph.run("MATCH (:Client)-[:HAS_ONBOARD]->() RETURN count(*)").evaluate()
+
+        BuildClientOnboard('summary-cid', 'summary-cname').init()
+
+        compliance = Client.compliance_summary()
+
+        assert compliance['counts']['clients'] == clients + 1
+        assert len(compliance['rows']) == clients + 1
+
+    def test_project(self):
+
+        clients = Client.project()
+
+        assert len(clients) == self.NUM_CLIENTS
+        assert [_.company_name for _ in clients] == sorted(_.company_name for _ in clients)
+        assert Client.project(('company_id',))[0]._fields == ('company_id',)
 
 
 class TestOnboard(object):
 
     def test_create(self, db):
 
-        NUM_PROPERTIES = 3
+        NUM_PROPERTIES = 4
 
         onboard = Onboard.create()
 
@@ -114,6 +158,7 @@ class TestOnboard(object):
         assert result['valid_onboard'] == True
         assert arrow.get(result['time_started'])
         assert result['time_completed'] is None
+        assert result['changed_at'] == result['time_created']
         assert len(result.viewkeys()) == NUM_PROPERTIES
 
         db.graph.run((
@@ -121,42 +166,75 @@ class TestOnboard(object):
                     "delete o"
                 ))
 
-    @patch('models.Onboard.select')
-    def test_average_time_to_completion(self, select_patch):
+    @patch('models.Onboard.project_columns')
+    def test_average_time_to_completion(self, columns_patch):
 
         AVERAGE_TTC = 3 # in this case, by design (see loop below)
 
-        result_mocks = [MagicMock() for i in range(3)]
-
         a = arrow.utcnow()
-        for counter, result_mock in enumerate(result_mocks):
-            result_mock.time_created = a.timestamp
-            result_mock.time_completed = a.timestamp + 2 * counter + 1
-
-        select_patch.return_value = result_mocks
+        columns_patch.return_value = {
+            'time_created': np.array([a.timestamp] * 4, dtype=np.float64),
+            'time_completed': np.array(
+                [a.timestamp + 2 * counter + 1 for counter in range(3)] + [np.nan])}
 
         average_ttc = Onboard.compute_average()
 
         assert average_ttc == AVERAGE_TTC
 
-    @patch('models.Onboard.select')
-    def test_average_time_to_completion_is_None_when_time_completed_not_present(self, select_patch):
+    @patch('models.Onboard.project_columns')
+    def test_average_time_to_completion_is_None_when_time_completed_not_present(self, columns_patch):
 
         AVERAGE_TTC = None
 
-        result_mocks = [MagicMock() for i in range(3)]
-
         a = arrow.utcnow()
-        for counter, result_mock in enumerate(result_mocks):
-            result_mock.time_created = a.timestamp
-            result_mock.time_completed = None
-
-        select_patch.return_value = result_mocks
+        columns_patch.return_value = {
+            'time_created': np.array([a.timestamp] * 3, dtype=np.float64),
+            'time_completed': np.array([np.nan] * 3)}
 
         average_ttc = Onboard.compute_average()
 
         assert average_ttc == AVERAGE_TTC
 
+    def test_project_columns(self, rollback):
+
+        onboard = Onboard.create()
+
+        columns = Onboard.project_columns(('time_created', 'time_completed', 'completed'))
+
+        assert onboard.time_created in columns['time_created'].tolist()
+        assert len(columns['time_completed']) == len(columns['time_created'])
+        assert len(columns['completed']) == len(columns['time_created'])
+        assert isinstance(columns['completed'], list)
+
+    def test_project_columns_keeps_the_high_mask_bits(self, rollback):
+
+        MASK = 2 ** 62 + 1
+
+        onboard = Onboard.create()
+        onboard.completed_steps = MASK
+        rollback.graph.push(onboard)
+
+        columns = Onboard.project_columns(('completed_steps', 'time_created'))
+
+        assert columns['completed_steps'].dtype == np.int64
+        assert MASK in columns['completed_steps'].tolist()
+
+    def test_missing_document_ids(self):
+
+        REQUIRED = 0b111011
+        SUBMITTED = 0b000110
+
+        assert Onboard.missing_document_ids(REQUIRED, SUBMITTED) == [0, 3, 4, 5]
+        assert Onboard.missing_document_ids(None, None) == []
+
+    def test_document_bit_is_bounded(self):
+
+        assert Onboard.document_bit(0) == 1
+        assert Onboard.document_bit(62) == 2 ** 62
+
+        with pytest.raises(ValueError):
+            Onboard.document_bit(Onboard.MAX_DOCUMENTS)
+
     def test_onboard_has_activity_rel(self, db):
         activity = Activity.create()
         onboard = Onboard.create()
@@ -180,7 +258,7 @@ class TestOnboard(object):
 
 class TestBuildClientOnboard(object):
 
-    def test_initialize_new_client(self, db):
+    def test_initialize_new_client(self, rollback):
 
         COMPANY_ID = 'new_company_id'
         COMPANY_NAME = 'new_company_name'
@@ -189,7 +267,7 @@ class TestBuildClientOnboard(object):
         build_client = BuildClientOnboard(COMPANY_ID, COMPANY_NAME)
         build_client.init()
 
-        cursor = db.graph.run((
+        cursor = rollback.graph.run((
                 "match (c:Client)-[r:%s]->(o) "
                 "where c.company_id='%s' "
                 "return c, r, o" % (REL_TYPE, COMPANY_ID)
@@ -204,22 +282,16 @@ class TestBuildClientOnboard(object):
         assert onboard is not None
         assert REL_TYPE in has_onboard.types()
 
-        db.graph.run((
-                "match (c:Client)-[r:%s]->(o) "
-                "where c.company_id='%s' "
-                "delete c, r, o" % (REL_TYPE, COMPANY_ID)
-            ))
-
 
 class TestGenericProcess(object):
 
-    def test_create(self, db):
+    def test_create(self, rollback):
 
         LABELS = ['GenericProcess']
 
         process = GenericProcess.create()
 
-        cursor = db.graph.run((
+        cursor = rollback.graph.run((
             "match (p:GenericProcess) "
             "return p"
         ))
@@ -228,11 +300,6 @@ class TestGenericProcess(object):
         result = cursor.current()['p']
         assert all([label in result.labels() for label in LABELS])
 
-        db.graph.run((
-            "match (p:GenericProcess) "
-            "delete p"
-        ))
-
 
 class TestGenericStep(object):
 
@@ -268,6 +335,14 @@ class TestGenericStep(object):
 
         assert len(all_steps) == 1 + 2 # 1 from setup, 2 here
 
+    def test_project(self, db):
+
+        steps = GenericStep.project(('step_number', 'task_name'))
+
+        assert [_.step_number for _ in steps] == sorted(_.step_number for _ in steps)
+        assert sorted(tuple(_) for _ in steps) == sorted(
+            (_.step_number, _.task_name) for _ in GenericStep.all())
+
     def test_get_by_step_number(self):
 
         step = GenericStep.get_by_step_number(self.STEP_NUMBER)
@@ -395,6 +470,27 @@ class TestBuildGenericProcess(object):
 
         assert results == self.DEPENDENCIES
 
+    def test_dependency_masks(self, db):
+
+        cursor = db.graph.run((
+            "match (:GenericProcess)-[:HAS_STEP]->(s) "
+            "return s.step_number AS step_number, s.dependency_mask AS mask"
+        ))
+        masks = dict((_['step_number'], set(GenericStep.mask_steps(_['mask']))) for _ in cursor)
+
+        assert len(masks) == self.NUM_STEPS
+        for step_number, depends in masks.items():
+            assert depends == self.DEPENDENCIES.get(step_number, set())
+
+    def test_process_step_mask(self, db):
+
+        cursor = db.graph.run((
+            "match (p:GenericProcess) "
+            "return p.step_mask AS mask"
+        ))
+
+        assert cursor.evaluate() == 2 ** self.NUM_STEPS - 1
+
     def test_requires_document_rel(self, db):
 
         cursor = db.graph.run((
@@ -458,15 +554,104 @@ class TestBuildOnboardGenericProcess(object):
 
         assert cursor.forward() == 0
 
-    def test_missing_docs_rels(self, db):
+    def test_missing_docs_state(self, db):
+
+        cursor = db.graph.run((
+            "match (:Client {company_id: '%s'})-[:HAS_ONBOARD]->(o) "
+            "return o.required_documents AS required, o.submitted_documents AS submitted" % self.COMPANY_ID
+        ))
+
+        assert cursor.forward() == 1
+        assert cursor.current()['required'] == 2 ** len(self.generic.document_metadata) - 1
+        assert cursor.current()['submitted'] == 0
+
+    def test_no_missing_docs_rels(self, db):
 
         cursor = db.graph.run((
             "match (:Onboard)-[:MISSING_DOCUMENT]->(d) "
             "return d"
         ))
 
-        assert len([_ for _ in cursor]) == len(self.generic.document_metadata)
-        assert cursor.current()['d'].has_label('GenericDocument')
+        assert cursor.forward() == 0
+
+    def test_get_missing_documents(self, db):
+
+        missing = Onboard.get_missing_documents(self.COMPANY_ID)
+
+        assert missing == [_['id'] for _ in self.generic.document_metadata]
+
+    def test_list_all_with_document_status(self, db):
+
+        results = Client.list_all_with_document_status()
+
+        assert len(results) == len(self.generic.document_metadata)
+        assert [_['step_number'] for _ in results] == sorted(
+            _['for_step'] for _ in self.generic.document_metadata)
+        assert all([_.company_id == self.COMPANY_ID for _ in results])
+
+    def test_onboard_is_pinned_to_the_process_version(self, db):
+
+        cursor = db.graph.run((
+            "match (:Client {company_id: '%s'})-[:HAS_ONBOARD]->(o)-[:MUST_FOLLOW]->(p) "
+            "return o.process_version AS pinned, p.version AS version" % self.COMPANY_ID
+        ))
+
+        assert cursor.forward() == 1
+        assert cursor.current()['pinned'] == self.generic.process.version
+        assert cursor.current()['version'] == self.generic.process.version
+
+    def test_projected_completions(self, db):
+
+        projections = Onboard.projected_completions()
+        version = self.generic.process.version
+        days = projections['critical_paths'][version]['duration']
+        onboard = projections['onboards'][0]
+
+        assert len(projections['onboards']) == 1
+        assert onboard['company_id'] == self.COMPANY_ID
+        assert onboard['version'] == version
+        # no step done yet, so counted from when the onboard was created
+        assert onboard['expected_completion'] == onboard['last_progress_at'] + days * 24 * 60 * 60
+
+    def test_unknown_process_version(self, db):
+
+        with pytest.raises(LookupError):
+            BuildOnboardGenericProcess(self.COMPANY_ID, version=-1)
+
+    def test_document_ids_fit_the_masks(self, db):
+
+        assert GenericDocument.out_of_range_ids() == []
+
+    def test_migrate_missing_document_rels(self, db):
+
+        # an onboard as built before the masks: a relationship per document
+        db.graph.run((
+            "match (:Client {company_id: $company_id})-[:HAS_ONBOARD]->(o), (d:GenericDocument) "
+            "remove o.required_documents, o.submitted_documents "
+            "foreach (_ in case when d.document_id = 0 then [1] else [] end | "
+            "  merge (o)-[:SUBMITTED_DOCUMENT]->(d)) "
+            "foreach (_ in case when d.document_id = 0 then [] else [1] end | "
+            "  merge (o)-[:MISSING_DOCUMENT]->(d))"
+        ), {'company_id': self.COMPANY_ID})
+
+        assert GenericDocument.migrate_relationships(batch_size=1) == 1
+        assert GenericDocument.migrate_relationships() == 0
+
+        cursor = db.graph.run((
+            "match (:Client {company_id: $company_id})-[:HAS_ONBOARD]->(o) "
+            "return o.required_documents AS required, o.submitted_documents AS submitted, "
+            "size((o)-[:MISSING_DOCUMENT|SUBMITTED_DOCUMENT]->()) AS rels"
+        ), {'company_id': self.COMPANY_ID})
+
+        assert cursor.forward() == 1
+        assert cursor.current()['required'] == 2 ** len(self.generic.document_metadata) - 1
+        assert cursor.current()['submitted'] == 1
+        assert cursor.current()['rels'] == 0
+
+        db.graph.run((
+            "match (:Client {company_id: $company_id})-[:HAS_ONBOARD]->(o) "
+            "set o.submitted_documents = 0"
+        ), {'company_id': self.COMPANY_ID})
 
 
 class TestActivityNode(object):
@@ -747,13 +932,14 @@ class TestBuildAction(object):
         cls.client.init()
         cls.onboard_activity = BuildOnboardActivity(cls.CID)
         cls.onboard_activity.init()
-        cls.build_action = BuildAction(cls.CID)
 
         cls.STEP_NUMBER = 9523
         cls.step = GenericStep.create('taskname', cls.STEP_NUMBER, 1235)
 
         cls.build_generic = BuildGenericProcess()
         cls.build_generic.init()
+        BuildOnboardGenericProcess(cls.CID).init()
+        cls.build_action = BuildAction(cls.CID)
 
         # completed dependencies
         cls.STEPS_COMPLETED = [0, 4]
@@ -920,6 +1106,17 @@ class TestBuildAction(object):
 
         self.clear_action_nodes_and_rels()
 
+    def test_new_action_commits_with_its_event(self, db):
+        self.clear_action_nodes_and_rels()
+
+        with patch('models.outbox.append', side_effect=RuntimeError('outbox down')):
+            with pytest.raises(RuntimeError):
+                self.build_action.new_action(self.STEP_NUMBER)
+
+        assert db.graph.run("match (ac:Action) return count(ac)").evaluate() == 0
+
+        self.clear_action_nodes_and_rels()
+
     def test_new_action_with_steps(self, db):
 
         for step in self.STEPS_COMPLETED:
@@ -945,6 +1142,15 @@ class TestBuildAction(object):
         for i, num_depends in zip(range(5), self.NUM_DEPENDS_MAP):
             assert self.build_action._num_dependencies(i) == num_depends
 
+    def test_dependencies_of_a_stored_only_version_follow_must_follow(self):
+
+        process, self.build_action.process = self.build_action.process, None
+        try:
+            for i, num_depends in zip(range(5), self.NUM_DEPENDS_MAP):
+                assert self.build_action._num_dependencies(i) == num_depends
+        finally:
+            self.build_action.process = process
+
     def test_that_first_step_is_completed_dependency_for_the_fourth_step(self):
 
         for step in self.STEPS_COMPLETED:
@@ -994,27 +1200,10 @@ class TestBuildAction(object):
 
         self.clear_action_nodes_and_rels()
 
-    def test_marking_a_step_as_invalid(self, db):
-
-        STEP = 3
-        VALID = False
-
-        self.build_action._mark_step_invalid(STEP)
-
-        cursor = db.graph.run((
-            "match (o:Onboard)-[:INVALID]->(gs) "
-            "return gs, o"
-        ))
-
-        assert cursor.forward() == 1
-        assert cursor.current()['gs']['step_number'] == STEP
-        assert cursor.current()['o']['valid_onboard'] == VALID
-        assert cursor.forward() == 0 
-
     def test_that_a_step_with_no_dependencies_gets_marked_correctly_with_aware_step_completion(self, db):
         db.graph.run((
             "match (o:Onboard)-[i:INVALID]->() "
-            "set o.valid_onboard=true "
+            "set o.valid_onboard=true, o.invalid_steps=0 "
             "delete i"
         ))
         db.graph.pull(self.build_action.onboard)
@@ -1023,7 +1212,7 @@ class TestBuildAction(object):
         num_steps = 3
 
         for i in range(num_steps):
-            self.build_action._dependency_aware_mark_step_complete(i)
+            self.build_action.aware_mark_step_complete(i)
 
         cursor = db.graph.run((
             "match (o:Onboard)-[:HAS_COMPLETED]->(gs) "
@@ -1049,7 +1238,7 @@ class TestBuildAction(object):
         num_steps = 2
 
         for i in range(num_steps):
-            self.build_action._dependency_aware_mark_step_complete(i + 3)
+            self.build_action.aware_mark_step_complete(i + 3)
 
         cursor = db.graph.run((
             "match (o:Onboard)-[:HAS_COMPLETED]->(gs) "
@@ -1083,9 +1272,9 @@ class TestBuildAction(object):
 
         assert False
 
-        self.build_action._dependency_aware_mark_step_complete(3)
-        self.build_action._dependency_aware_mark_step_complete(4)
-        self.build_action._dependency_aware_mark_step_complete(1)
+        self.build_action.aware_mark_step_complete(3)
+        self.build_action.aware_mark_step_complete(4)
+        self.build_action.aware_mark_step_complete(1)
 
         cursor = db.graph.run((
             "match (o:Onboard)-[r:HAS_COMPLETED|INVALID]->() "
@@ -1116,70 +1305,6 @@ class TestBuildAction(object):
         assert arrow.get(cursor.current()['time_completed'])
         assert cursor.forward() == 0
 
-    def test_step_aware_mark_onboard_complete_does_not_mark_onboard_as_complete_if_steps_are_not_complete(self, db):
-        # TODO this functionality changed bc of _completed_dependencies
-        # it now finds the completed dependencies off action nodes
-        # these tests need to be changed appropriately
-
-        COMPLETION_STATUS = False
-
-        # reset some stuff for this test
-        db.graph.run((
-            "match (o:Onboard)-[c:HAS_COMPLETED]->() "
-            "set o.completed=false "
-            "delete c"
-        ))
-        # pull down the change for py2neo
-        db.graph.pull(self.build_action.onboard) 
-
-        # mark some steps as complete
-        self.build_action._mark_step_complete(1)
-        self.build_action._mark_step_complete(2)
-
-        # try to mark onboard as complete (should have no effect)
-        self.build_action._step_aware_mark_onboard_complete()
-
-        cursor = db.graph.run((
-            "match (o:Onboard) "
-            "return o.completed AS completed"
-        ))
-
-        assert cursor.forward() == 1
-        assert cursor.current()['completed'] == COMPLETION_STATUS
-        assert cursor.forward() == 0
-
-    def test_step_aware_mark_onboard_complete_suceeds_if_all_steps_have_been_completed(self, db):
-        # TODO this functionality changed bc of _completed_dependencies
-        # it now finds the completed dependencies off action nodes
-        # these tests need to be changed appropriately
-
-        COMPLETION_STATUS = True
-
-        # reset some stuff for this test
-        db.graph.run((
-            "match (o:Onboard)-[c:HAS_COMPLETED]->() "
-            "set o.completed=false "
-            "delete c"
-        ))
-        # pull down the change for py2neo
-        db.graph.pull(self.build_action.onboard) 
-
-        # mark all steps as complete
-        for i in range(len(GenericStep.all())):
-            self.build_action._mark_step_complete(i)
-
-        # mark onboard as complete
-        self.build_action._step_aware_mark_onboard_complete()
-
-        cursor = db.graph.run((
-            "match (o:Onboard) "
-            "return o.completed AS completed"
-        ))
-
-        assert cursor.forward() == 1
-        assert cursor.current()['completed'] == COMPLETION_STATUS
-        assert cursor.forward() == 0
-
     def test_that_aware_step_mark_completion_will_NOT_mark_onboard_complete_if_steps_incomplete(self, db):
         # TODO this functionality changed bc of _completed_dependencies
         # it now finds the completed dependencies off action nodes
@@ -1189,7 +1314,7 @@ class TestBuildAction(object):
 
         db.graph.run((
             "match (o:Onboard)-[c:HAS_COMPLETED]->() "
-            "set o.completed=false "
+            "set o.completed=false, o.completed_steps=0 "
             "delete c"
         ))
         db.graph.pull(self.build_action.onboard)
@@ -1216,12 +1341,12 @@ class TestBuildAction(object):
 
         db.graph.run((
             "match (o:Onboard)-[c:HAS_COMPLETED]->() "
-            "set o.completed=false "
+            "set o.completed=false, o.completed_steps=0 "
             "delete c"
         ))
         db.graph.pull(self.build_action.onboard)
 
-        for i in range(len(GenericStep.all())):
+        for i in range(len(self.build_generic.tasks)):
             self.build_action.aware_mark_step_complete(i)
 
         cursor = db.graph.run((
@@ -1241,7 +1366,7 @@ class TestBuildAction(object):
         db.graph.run((
             "match (o:Onboard)-[c:HAS_COMPLETED]->() "
             "match (o)-[i:INVALID]->() "
-            "set o.valid_onboard=true "
+            "set o.valid_onboard=true, o.completed_steps=0, o.invalid_steps=0 "
             "delete c, i"
         ))
         db.graph.pull(self.build_action.onboard)
@@ -1267,6 +1392,28 @@ class TestBuildAction(object):
         assert cursor.current()['count'] == NUM_INVALID
         assert cursor.forward() == 0
 
+    def test_that_aware_mark_step_complete_returns_the_new_onboard_state(self, db):
+
+        db.graph.run((
+            "match (o:Onboard)-[r:HAS_COMPLETED|INVALID]->() "
+            "set o.valid_onboard=true, o.completed=false, o.completed_steps=0, o.invalid_steps=0 "
+            "delete r"
+        ))
+        db.graph.pull(self.build_action.onboard)
+
+        state = self.build_action.aware_mark_step_complete(4)
+
+        assert state['satisfied'] is False
+        assert state['valid_onboard'] is False
+        assert state['completed'] is False
+        assert state['completed_steps'] == Onboard.step_bit(4)
+        assert state['invalid_steps'] == Onboard.step_bit(4)
+
+        state = self.build_action.aware_mark_step_complete(4)
+
+        assert state['completed_steps'] == Onboard.step_bit(4)
+        assert state['invalid_steps'] == Onboard.step_bit(4)
+
     def test_mark_step_complete(self, db):
         # TODO this functionality changed bc of _completed_dependencies
         # it now finds the completed dependencies off action nodes
@@ -1322,23 +1469,48 @@ class TestUpdateClientOnboard(object):
         self.update_onboard.submit_document(self.DOCUMENT_ID_TO_SUBMIT)
 
         cursor = db.graph.run((
-            "match (:Onboard)-[:SUBMITTED_DOCUMENT]->(d) "
-            "return d"
+            "match (o:Onboard) "
+            "return o.submitted_documents AS submitted"
         ))
 
         assert cursor.forward() == 1
-        assert cursor.current()['d']['document_id'] == self.DOCUMENT_ID_TO_SUBMIT
+        assert cursor.current()['submitted'] == 2 ** self.DOCUMENT_ID_TO_SUBMIT
         assert cursor.forward() == 0
+        assert self.update_onboard.onboard.submitted_documents == 2 ** self.DOCUMENT_ID_TO_SUBMIT
 
     def test_that_is_not_marked_as_missing_when_submitted(self, db):
 
-        cursor = db.graph.run((
-            "match (:Onboard)-[:MISSING_DOCUMENT]->(d) "
-            "where d.document_id=%d "
-            "return d" % self.DOCUMENT_ID_TO_SUBMIT
-        ))
+        missing = Onboard.get_missing_documents(self.COMPANY_ID)
 
-        assert cursor.forward() == 0
+        assert self.DOCUMENT_ID_TO_SUBMIT not in missing
+        assert len(missing) == len(self.generic.document_metadata) - 1
+
+    def test_that_resubmitting_a_document_is_a_no_op(self, db):
+
+        status = self.update_onboard.submit_document(self.DOCUMENT_ID_TO_SUBMIT)
+
+        assert status == 'document_%d was not missing' % self.DOCUMENT_ID_TO_SUBMIT
+        assert self.update_onboard.onboard.submitted_documents == 2 ** self.DOCUMENT_ID_TO_SUBMIT
+
+    def test_bulk_document_submission(self, db):
+
+        submissions = [
+            (self.COMPANY_ID, 2),
+            (self.COMPANY_ID, 3),
+            (self.COMPANY_ID, 3),
+            (self.COMPANY_ID, self.DOCUMENT_ID_TO_SUBMIT), # already submitted
+            ('no-such-company', 4),
+        ]
+
+        results = UpdateClientOnboard.submit_documents(submissions, batch_size=2)
+
+        assert [_['submitted'] for _ in results] == [True, True, True, False, False]
+        assert [(_['company_id'], _['document_id']) for _ in results] == submissions
+
+        missing = Onboard.get_missing_documents(self.COMPANY_ID)
+
+        assert not set([self.DOCUMENT_ID_TO_SUBMIT, 2, 3]) & set(missing)
+        assert len(missing) == len(self.generic.document_metadata) - 3
 
 
 class TestCompanyNode(object):
@@ -1572,6 +1744,34 @@ class TestUpdateEmployeeAccess(object):
         assert cursor.current()['s']['step_number'] == self.STEP_ACCESSED
         assert cursor.forward() == 0
 
+    def test_bulk_step_access(self, db):
+
+        results = UpdateEmployeeAccess.record_step_access([
+            (self.EMPLOYEE_ID, self.CLIENT_ID, self.STEP_ACCESSED),
+            (self.EMPLOYEE_ID, self.CLIENT_ID, self.STEP_ACCESSED),
+            (self.EMPLOYEE_ID, self.CLIENT_ID, 0),
+            (self.EMPLOYEE_ID, 'no-such-client', 0),
+        ])
+
+        assert results['recorded'] == 2
+        assert results['unmatched'] == [(self.EMPLOYEE_ID, 'no-such-client', 0)]
+
+        cursor = db.graph.run((
+            "match (:Project)-[a:ACCESSED_STEP]->(s) "
+            "return s.step_number AS step_number, a.count AS count, a.accessed_at AS accessed_at "
+            "order by step_number"
+        ))
+
+        assert cursor.forward() == 1
+        assert cursor.current()['step_number'] == 0
+        assert cursor.current()['count'] == 1
+        assert cursor.forward() == 1
+        assert cursor.current()['step_number'] == self.STEP_ACCESSED
+        # one access from setup_class, two from the batch
+        assert cursor.current()['count'] == 3
+        assert cursor.current()['accessed_at'] is not None
+        assert cursor.forward() == 0
+
 
 class TestApplicationNode(object):
 
@@ -1802,4 +2002,45 @@ class TestEmployeeAppAccess(object):
 
         assert cursor.forward() == 1
         assert isinstance(cursor.current()['app'], Node)
-        assert cursor.forward() == 0
\ No newline at end of file
+        assert cursor.forward() == 0
+
+    def test_role_map(self, db):
+
+        assert Application.role_map() == {'Crm': self.APP_1, 'Cloud': self.APP_1}
+
+    def test_unknown_role(self, db):
+
+        with pytest.raises(ValueError):
+            Application.name_by_role('Hr')
+
+    def test_bulk_grant(self, db):
+
+        Employee.push('bulk-employee', 'bulk@fuzz.org')
+        Application.push_erp('test-erp-app')
+
+        results = EmployeeAppAccess.grant([
+            ('bulk-employee', 'Crm'),
+            ('bulk-employee', 'Erp'),
+            ('bulk-employee', 'Erp'),
+            ('bulk-employee', 'Compliance'),
+            ('no-such-employee', 'Crm'),
+        ])
+
+        assert results['granted'] == 2
+        assert results['unmatched'] == [
+            ('bulk-employee', 'Compliance'), ('no-such-employee', 'Crm')]
+
+        cursor = db.graph.run((
+            "match (:Employee {id: 'bulk-employee'})-[:HAS_ACCESS_TO]->(app) "
+            "return app.name AS name order by name"
+        ))
+
+        assert [_['name'] for _ in cursor] == [self.APP_1, 'test-erp-app']
+
+    def test_access_matrix(self, db):
+
+        access = Employee.access_matrix()
+        row = access['employees'].index(self.ID)
+
+        assert [access['applications'][_] for _ in
+                access['indices'][access['indptr'][row]:access['indptr'][row + 1]]] == [self.APP_1]
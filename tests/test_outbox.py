@@ -0,0 +1,65 @@
+import json
+
+import outbox
+from models import BuildClientOnboard
+
+
+class TestEvents(object):
+
+    def test_event_data_is_compact_json(self):
+
+        event = outbox.event('step_completed', 'cid', step_number=2, invalid=False)
+
+        assert event == {
+            'kind': 'step_completed',
+            'key': 'cid',
+            'data': '{"invalid":false,"step_number":2}'}
+
+    def test_iter_ndjson(self):
+
+        lines = list(outbox.iter_ndjson([{'offset': 1}, {'offset': 2}]))
+
+        assert lines == ['{"offset": 1}\n', '{"offset": 2}\n']
+        assert [json.loads(_) for _ in lines] == [{'offset': 1}, {'offset': 2}]
+
+
+class TestOutbox(object):
+
+    def test_offsets_are_consecutive(self, rollback):
+
+        after = outbox.append(rollback.graph, [outbox.event('test', 'a')]) or 0
+        last = outbox.append(rollback.graph, [
+            outbox.event('test', 'b', n=1), outbox.event('test', 'c', n=2)], now=100)
+
+        events = outbox.read(rollback.graph, after)
+
+        assert last == after + 2
+        assert [(_['offset'], _['key'], _['data'], _['at']) for _ in events] == [
+            (after + 1, 'b', {'n': 1}, 100), (after + 2, 'c', {'n': 2}, 100)]
+        assert outbox.read(rollback.graph, last) == []
+
+    def test_no_events_appends_nothing(self, rollback):
+
+        assert outbox.append(rollback.graph, []) is None
+
+    def test_follow_stops_at_limit(self, rollback):
+
+        after = outbox.append(rollback.graph, [outbox.event('test', 'a')]) - 1
+        outbox.append(rollback.graph, [outbox.event('test', 'b'), outbox.event('test', 'c')])
+
+        events = list(outbox.follow(rollback.graph, after, limit=2))
+
+        assert [_['key'] for _ in events] == ['a', 'b']
+
+    def test_writes_append_events(self, rollback):
+
+        after = outbox.append(rollback.graph, [outbox.event('test', 'marker')])
+
+        client = BuildClientOnboard('outbox-cid', 'outbox-cname')
+        client.init()
+
+        events = outbox.read(rollback.graph, after)
+
+        assert [(_['kind'], _['key'], _['data']) for _ in events] == [
+            ('client_created', 'outbox-cid', {'company_name': 'outbox-cname'}),
+            ('onboard_created', 'outbox-cid', {'time_created': client.onboard.time_created})]
@@ -0,0 +1,87 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from projection import record_type, records, columns
+
+
+class TestRecord(object):
+
+    def test_fields(self):
+
+        Row = record_type('Row', ('company_id', 'completed'))
+        row = Row('cid', True)
+
+        assert row.company_id == 'cid'
+        assert row['completed'] is True
+        assert tuple(row) == ('cid', True)
+        assert row._asdict() == {'company_id': 'cid', 'completed': True}
+
+    def test_records_have_no_dict(self):
+
+        row = record_type('Row', ('company_id',))('cid')
+
+        assert not hasattr(row, '__dict__')
+        with pytest.raises(AttributeError):
+            row.other = 1
+
+    def test_records_are_hashable_tuples(self):
+
+        Row = record_type('Row', ('a', 'b'))
+
+        assert Row(1, 2)[0] == 1
+        assert len(set([Row(1, 2), Row(1, 2), Row(3, 4)])) == 2
+        assert isinstance(Row(1, 2), tuple)
+
+    def test_types_are_reused(self):
+
+        assert record_type('Row', ('a', 'b')) is record_type('Row', ('a', 'b'))
+
+    def test_invalid_field(self):
+
+        with pytest.raises(ValueError):
+            record_type('Row', ('a) DETACH DELETE (n',))
+
+    def test_records_from_rows(self):
+
+        Row = record_type('Row', ('a', 'b'))
+
+        assert records([(1, 2), (3, 4)], Row) == [Row(1, 2), Row(3, 4)]
+
+    def test_pickle(self):
+
+        row = record_type('Row', ('a', 'b'))(1, [2])
+
+        assert pickle.loads(pickle.dumps(row, 2)) == row
+
+
+class TestColumns(object):
+
+    def test_columns(self):
+
+        rows = [('cid-1', 10, None), ('cid-2', 20, 25)]
+
+        result = columns(rows, ('company_id', 'time_created', 'time_completed'),
+                         numeric=('time_created', 'time_completed'))
+
+        assert result['company_id'] == ['cid-1', 'cid-2']
+        assert result['time_created'].tolist() == [10, 20]
+        assert np.isnan(result['time_completed'][0])
+        assert result['time_completed'][1] == 25
+
+    def test_integer_columns_keep_every_bit(self):
+
+        mask = 2 ** 62 + 1
+        result = columns([(mask,), (None,)], ('completed_steps',), integer=('completed_steps',))
+
+        assert result['completed_steps'].dtype == np.int64
+        assert result['completed_steps'].tolist() == [mask, 0]
+        assert int(result['completed_steps'][0]) >> 62 & 1
+
+    def test_no_rows(self):
+
+        result = columns([], ('a', 'b'), numeric=('b',))
+
+        assert result['a'] == []
+        assert result['b'].size == 0
@@ -0,0 +1,148 @@
+import threading
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+class TestSingleFlight(object):
+
+    def test_do_returns_result(self):
+
+        flight = SingleFlight()
+
+        assert flight.do('key', lambda x: x + 1, 1) == 2
+        assert flight.in_flight() == 0
+
+    def test_concurrent_calls_share_one_execution(self):
+
+        NUM_CALLERS = 8
+
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def query():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'rows'
+
+        def caller():
+            results.append(flight.do('query', query))
+
+        leader = threading.Thread(target=caller)
+        leader.start()
+        started.wait(5)
+
+        followers = [threading.Thread(target=caller) for i in range(NUM_CALLERS - 1)]
+        for follower in followers:
+            follower.start()
+        while flight._calls['query'].waiters < NUM_CALLERS - 1:
+            pass
+        release.set()
+
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        assert len(calls) == 1
+        assert results == ['rows'] * NUM_CALLERS
+        assert flight.in_flight() == 0
+
+    def test_sequential_calls_are_not_coalesced(self):
+
+        flight = SingleFlight()
+        calls = []
+
+        @flight.coalesce('count')
+        def count():
+            calls.append(1)
+            return len(calls)
+
+        assert count() == 1
+        assert count() == 2
+
+    def test_exception_is_raised_and_key_released(self):
+
+        flight = SingleFlight()
+
+        def fail():
+            raise LookupError('no graph')
+
+        with pytest.raises(LookupError):
+            flight.do('key', fail)
+
+        assert flight.in_flight() == 0
+        assert flight.do('key', lambda: 'ok') == 'ok'
+
+    def test_after_fork_forgets_inherited_calls(self):
+
+        flight = SingleFlight()
+        flight._lock.acquire()
+        flight._calls['key'] = object()
+
+        flight.after_fork()
+
+        assert flight.in_flight() == 0
+        assert flight.do('key', lambda: 'ok') == 'ok'
+
+    def test_followers_get_their_own_copy(self):
+
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def query():
+            started.set()
+            release.wait(5)
+            return [1, 2]
+
+        def caller():
+            results.append(flight.do('query', query))
+
+        leader = threading.Thread(target=caller)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=caller)
+        follower.start()
+        while flight._calls['query'].waiters < 1:
+            pass
+        release.set()
+        for thread in (leader, follower):
+            thread.join(5)
+
+        results[0].append(3)
+
+        assert results[1] == [1, 2]
+
+    def test_scope_is_part_of_the_key(self):
+
+        scopes = ['a']
+        flight = SingleFlight(lambda: scopes[0])
+        keys = []
+
+        @flight.coalesce('query')
+        def query():
+            keys.extend(flight._calls)
+
+        query()
+        scopes[0] = 'b'
+        query()
+
+        assert keys == ['a:query:():[]', 'b:query:():[]']
+
+    def test_bypass_runs_the_call_alone(self):
+
+        flight = SingleFlight(bypass=lambda: True)
+        keys = []
+
+        @flight.coalesce('query')
+        def query():
+            keys.extend(flight._calls)
+            return 1
+
+        assert query() == 1
+        assert keys == []
@@ -0,0 +1,101 @@
+from extensions import db as _db, processes
+from definitions import ProcessRegistry
+from definitions import DAY
+from sla import SlaScanner
+from models import BuildClientOnboard, BuildGenericProcess, BuildOnboardGenericProcess
+
+
+PROCESS = {
+    'version': 1,
+    'tasks': [
+        {'task_name': 'a', 'duration': 1},
+        {'task_name': 'b', 'duration': 2},
+        {'task_name': 'c', 'duration': 3, 'depends_on': [0, 1]},
+    ],
+}
+
+
+class TestEvaluate(object):
+
+    def scanner(self):
+        registry = ProcessRegistry()
+        registry.register(PROCESS)
+        return SlaScanner(None, registry)
+
+    def onboard(self, completed_steps=0, last_step_at=None):
+        return {'version': 1, 'completed_steps': completed_steps,
+                'last_step_at': last_step_at, 'time_created': 0}
+
+    def test_nothing_due_yet(self):
+
+        overdue, next_due = self.scanner().evaluate(self.onboard(), DAY / 2)
+
+        assert overdue == []
+        assert next_due == DAY
+
+    def test_ready_steps_overdue(self):
+
+        overdue, next_due = self.scanner().evaluate(self.onboard(), 2 * DAY)
+
+        assert overdue == [{'step_number': 0, 'due_at': DAY}, {'step_number': 1, 'due_at': 2 * DAY}]
+        assert next_due is None
+
+    def test_due_counts_from_the_previous_completion(self):
+
+        overdue, next_due = self.scanner().evaluate(self.onboard(0b011, 10 * DAY), 11 * DAY)
+
+        assert overdue == []
+        assert next_due == 13 * DAY
+
+
+class TestSlaScanner(object):
+
+    COMPANY_ID = 'sla-cid'
+
+    @classmethod
+    def setup_class(cls):
+        BuildGenericProcess().init()
+        BuildClientOnboard(cls.COMPANY_ID, 'sla-cname').init()
+        BuildOnboardGenericProcess(cls.COMPANY_ID).init()
+
+    @classmethod
+    def teardown_class(cls):
+        _db.graph.run((
+            "match (n) where n:Client or n:Onboard or n:GenericProcess or n:GenericStep "
+            "or n:GenericDocument or n:Breach or n:SlaScan "
+            "detach delete n"
+        ))
+
+    def test_scan_is_incremental(self, db):
+
+        scanner = SlaScanner(db.graph, processes)
+        now = 2 ** 40
+        ready = [_ for _ in range(len(processes.latest.tasks))
+                 if not processes.latest.dependency_mask(_)]
+
+        first = scanner.run(now)
+        second = scanner.run(now + 1)
+
+        assert first['scanned'] == 1
+        assert first['overdue'] == len(ready)
+        assert second['scanned'] == 0
+        assert second['last_run'] == now
+
+        breaches = scanner.breaches()
+
+        assert sorted(_['step_number'] for _ in breaches) == ready
+        assert all([_['company_id'] == self.COMPANY_ID for _ in breaches])
+        assert not any([_['resolved'] for _ in breaches])
+
+    def test_changes_in_the_second_of_the_last_run_are_scanned(self, db):
+
+        scanner = SlaScanner(db.graph, processes)
+        now = 2 ** 41
+        scanner.run(now)
+        # written after the scan read the onboards, within the same second
+        db.graph.run((
+            "match (:Client {company_id: $company_id})-[:HAS_ONBOARD]->(o) "
+            "set o.changed_at = $now"
+        ), {'company_id': self.COMPANY_ID, 'now': now})
+
+        assert scanner.run(now + 1)['scanned'] == 1
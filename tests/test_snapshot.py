@@ -0,0 +1,85 @@
+import json
+import zlib
+
+import pytest
+
+from extensions import db as _db
+from models import BuildGenericProcess
+import snapshot
+
+
+class TestSnapshotFormat(object):
+
+    def test_encode_decode_round_trip(self):
+
+        data = {
+            'label_sets': [('Client', 'Person')],
+            'types': ['HAS_ONBOARD'],
+            'nodes': [(0, {'company_id': 'cid'}), (0, {'company_id': 'cid2'})],
+            'relationships': [(0, 0, 1, {})],
+        }
+
+        assert snapshot.decode(snapshot.encode(data)) == data
+
+    def test_decode_rejects_other_files(self):
+
+        with pytest.raises(ValueError):
+            snapshot.decode(b'not a snapshot')
+
+    def test_decode_rejects_pickled_snapshots(self):
+
+        with pytest.raises(ValueError):
+            snapshot.decode(snapshot.MAGIC + bytearray([1]) + b'pickled')
+
+    def test_payload_is_json(self):
+
+        data = snapshot.encode({'label_sets': [], 'types': [], 'nodes': [], 'relationships': []})
+
+        payload = zlib.decompress(bytes(data[len(snapshot.MAGIC) + 1:])).decode('utf-8')
+
+        assert json.loads(payload) == {'label_sets': [], 'types': [], 'nodes': [], 'relationships': []}
+
+
+class TestSnapshotDumpRestore(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.generic = BuildGenericProcess()
+        cls.generic.init()
+
+    @classmethod
+    def teardown_class(cls):
+        _db.graph.run("match (n) detach delete n")
+
+    def count(self, db):
+        cursor = db.graph.run((
+            "match (n) "
+            "optional match (n)-[r]->() "
+            "return count(distinct n) AS nodes, count(r) AS rels"
+        ))
+        cursor.forward()
+        return cursor.current()['nodes'], cursor.current()['rels']
+
+    def test_dump_and_restore(self, db, tmpdir):
+
+        path = str(tmpdir.join('model.snap'))
+        counts_before = self.count(db)
+
+        dumped = snapshot.dump(db.graph, path, batch_size=4)
+        db.graph.run("match (n) detach delete n")
+        restored = snapshot.restore(db.graph, path, batch_size=4)
+
+        assert dumped == restored
+        assert (dumped['nodes'], dumped['relationships']) == counts_before
+        assert self.count(db) == counts_before
+
+        cursor = db.graph.run((
+            "match (:GenericProcess)-[:NEXT*]->(s) "
+            "return s order by s.step_number"
+        ))
+        assert [result['s']['step_number'] for result in cursor] == list(range(5))
+
+        cursor = db.graph.run((
+            "match (n:%s) return n" % snapshot.RESTORE_LABEL
+        ))
+        assert cursor.forward() == 0
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+from click.testing import CliRunner
+from mock import patch
+
+import startup
+import _cliapp
+
+
+class TestStartupReport(object):
+
+    def test_report(self):
+
+        report = startup.report([('import models', 0.25), ('modules loaded', 412)])
+
+        assert report.splitlines() == [
+            'import models                   250.0 ms',
+            'modules loaded                    412']
+
+    def test_profile(self):
+
+        stages = startup.profile()
+        names = [stage for stage, _ in stages]
+
+        assert names == ['import %s' % _ for _ in startup.MODULES] + [
+            'create_app', 'total', 'modules loaded']
+        assert all([value >= 0 for _, value in stages])
+        assert dict(stages)['modules loaded'] > len(startup.MODULES)
+
+
+class TestCliApp(object):
+
+    def test_commands_that_need_no_app_do_not_create_it(self):
+
+        with patch('factory.create_app') as create_app, \
+                patch('startup.profile', return_value=[('total', 0.5)]):
+            result = CliRunner().invoke(_cliapp.cli, ['startup-profile'])
+
+        assert result.exit_code == 0
+        assert result.output.split() == ['total', '500.0', 'ms']
+        assert not create_app.called
+
+    def test_importing_the_cli_loads_no_models(self):
+
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        loaded = subprocess.check_output([sys.executable, '-c', (
+            'import sys, _cliapp; '
+            'print(sorted(_ for _ in ("models", "extensions", "graphdb", "py2neo") if _ in sys.modules))')],
+            cwd=root)
+
+        assert loaded.strip() == b'[]'
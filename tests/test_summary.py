@@ -0,0 +1,59 @@
+import summary
+
+
+class TestRows(object):
+
+    def test_row_from_client_and_onboard(self):
+
+        row = summary.row({
+            'company_id': 'cid', 'company_name': 'cname', 'completed': None,
+            'valid_onboard': None, 'required': 0b111, 'submitted': 0b001})
+
+        assert row == ('cid', 'cname', False, True, 2)
+
+    def test_arrays_round_trip(self):
+
+        rows = [('a', 'A', True, True, 0), ('b', 'B', False, False, 3)]
+
+        arrays = summary.to_arrays(rows)
+
+        assert arrays['company_ids'] == ['a', 'b']
+        assert arrays['missing_documents'] == [0, 3]
+        assert summary.from_arrays(arrays) == rows
+
+    def test_counts(self):
+
+        arrays = summary.to_arrays([
+            ('a', 'A', True, True, 0), ('b', 'B', False, False, 1), ('c', 'C', False, True, 2)])
+
+        assert (arrays['clients'], arrays['complete'], arrays['incomplete'], arrays['invalid']) == (3, 1, 2, 1)
+
+    def test_empty_summary(self):
+
+        arrays = summary.to_arrays([])
+
+        assert summary.from_arrays(dict((_, None) for _ in summary.ARRAYS)) == []
+        assert arrays['clients'] == 0
+
+
+class TestMerge(object):
+
+    ROWS = [('a', 'Alpha', False, True, 1), ('c', 'Charlie', False, True, 0)]
+
+    def test_refreshed_rows_replace_old_ones(self):
+
+        merged = summary.merge(self.ROWS, [('a', 'Alpha', True, True, 0)], ['a'])
+
+        assert merged == [('a', 'Alpha', True, True, 0), ('c', 'Charlie', False, True, 0)]
+
+    def test_new_rows_are_kept_sorted_by_name(self):
+
+        merged = summary.merge(self.ROWS, [('b', 'Bravo', False, True, 2)], ['b'])
+
+        assert [_[0] for _ in merged] == ['a', 'b', 'c']
+
+    def test_clients_without_a_refreshed_row_are_dropped(self):
+
+        merged = summary.merge(self.ROWS, [], ['c'])
+
+        assert merged == [('a', 'Alpha', False, True, 1)]
@@ -0,0 +1,38 @@
+from models import BuildGenericProcess
+from wipe import ChunkedWipe, wipe_graph
+
+
+class TestChunkedWipe(object):
+
+    def test_wipe_in_chunks(self, db):
+
+        generic = BuildGenericProcess()
+        generic.init()
+
+        cursor = db.graph.run((
+            "match (n) "
+            "optional match (n)-[r]->() "
+            "return count(distinct n) AS nodes, count(r) AS rels"
+        ))
+        cursor.forward()
+        nodes, rels = cursor.current()['nodes'], cursor.current()['rels']
+
+        reports = []
+        deleted = wipe_graph(db.graph, batch_size=3, progress=lambda *args: reports.append(args))
+
+        assert deleted == {'relationships': rels, 'nodes': nodes}
+        assert reports[0] == ('relationships', 3)
+        assert ('GenericStep', 3) in reports
+        assert ('GenericStep', 5) in reports
+        # each stage reports its own running count, the last of each adds up to the total
+        last = dict(reports)
+        assert sum(count for stage, count in last.items() if stage != 'relationships') == nodes
+
+        cursor = db.graph.run("match (n) return n")
+        assert cursor.forward() == 0
+
+    def test_wipe_of_an_empty_graph_is_a_no_op(self, db):
+
+        wipe = ChunkedWipe(db.graph)
+
+        assert wipe.run() == {'relationships': 0, 'nodes': 0}
@@ -1,18 +1,66 @@
-from flask import Blueprint, jsonify, render_template
-from extensions import db
+import time
+
+from flask import (Blueprint, Response, abort, current_app, jsonify, render_template, request,
+                   stream_with_context, url_for)
+from extensions import db, cache, jobs, processes
+from jobs import JobConflict, RUNNING
+from wipe import wipe_graph
+from sla import SlaScanner
+import matrix
+import outbox
 from models import build_model, build_clients
-from models import Client, Onboard
+from models import Client, Onboard, Employee, UpdateClientOnboard, UpdateEmployeeAccess, EmployeeAppAccess
 
 
 bp = Blueprint('bp', __name__)
 
+def _wipe(report=None):
+    def progress(stage, deleted):
+        current_app.logger.info('wipe: %d deleted (%s)', deleted, stage)
+        if report is not None:
+            report('wiping: %d deleted (%s)' % (deleted, stage))
+    deleted = wipe_graph(db.graph, current_app.config['WIPE_BATCH_SIZE'], progress)
+    cache.invalidate()
+    return deleted
+
+def _hashable(rows):
+    '''whether every value of the rows can key a dict, lists and dicts from json can't'''
+    return not any(isinstance(_, (list, dict)) for row in rows for _ in row)
+
+def _rebuild(builder, progress):
+    deleted = _wipe(progress)
+    progress('building')
+    return {'status': builder(), 'deleted': deleted}
+
+def _sla_scan(progress):
+    return SlaScanner(db.graph, processes).run(int(time.time()))
+
+def _enqueue(name, func, *args, **kwargs):
+    group = kwargs.pop('group', None)
+    try:
+        if group is None:
+            job_id = jobs.submit(name, func, *args)
+        else:
+            job_id = jobs.submit_exclusive(group, name, func, *args)
+    except JobConflict as e:
+        response = jsonify({'error': str(e), 'job': e.job['id']})
+        response.status_code = 409
+        response.headers['Location'] = url_for('bp.job', job_id=e.job['id'])
+        return response
+    response = jsonify({'job': job_id, 'status': jobs.get(job_id)['status']})
+    response.status_code = 202
+    response.headers['Location'] = url_for('bp.job', job_id=job_id)
+    return response
+
 @bp.route('/')
 def index():
     return render_template('index.html')
 
 @bp.route('/compliance')
 def compliance():
-    return render_template('compliance.html', clients = Client.list_all_with_compliance_status())
+    counts = Client.compliance_summary()['counts']
+    return render_template('compliance.html', clients = Client.list_all_with_compliance_status(),
+                           counts = counts)
 
 @bp.route('/funnel')
 def funnel():
@@ -40,18 +88,100 @@ def provenance():
 
 @bp.route('/build')
 def build():
-    
-    db.graph.run("MATCH (n) DETACH DELETE n")
-    
-    m = build_model()
-
-    return jsonify({'status': m})
+    return _enqueue('build', _rebuild, build_model, group='graph')
 
 @bp.route('/create_clients')
 def create_clients():
-
-    db.graph.run("match (n) detach delete n")
-
-    m = build_clients()
-
-    return jsonify({'status': m})
+    return _enqueue('create_clients', _rebuild, build_clients, group='graph')
+
+@bp.route('/onboards/eta')
+def onboard_eta():
+    projections = Onboard.projected_completions()
+    return jsonify({
+        'critical_paths': dict((str(version), path) for version, path in
+                               projections['critical_paths'].items()),
+        'onboards': projections['onboards']})
+
+@bp.route('/documents/submissions', methods=['POST'])
+def submit_documents():
+    payload = request.get_json(silent=True) or {}
+    try:
+        submissions = [(_['company_id'], int(_['document_id'])) for _ in payload['submissions']]
+    except (KeyError, TypeError, ValueError):
+        abort(400)
+    if not _hashable(submissions):
+        abort(400)
+    results = UpdateClientOnboard.submit_documents(submissions)
+    return jsonify({
+        'submitted': sum(1 for _ in results if _['submitted']),
+        'results': results})
+
+@bp.route('/access/steps', methods=['POST'])
+def record_step_access():
+    payload = request.get_json(silent=True) or {}
+    try:
+        accesses = [(_['employee_id'], _['client_id'], int(_['step_number']))
+                    for _ in payload['accesses']]
+    except (KeyError, TypeError, ValueError):
+        abort(400)
+    if not _hashable(accesses):
+        abort(400)
+    results = UpdateEmployeeAccess.record_step_access(accesses)
+    return jsonify({
+        'recorded': results['recorded'],
+        'unmatched': [dict(zip(('employee_id', 'client_id', 'step_number'), _))
+                      for _ in results['unmatched']]})
+
+@bp.route('/access/applications', methods=['POST'])
+def grant_application_access():
+    payload = request.get_json(silent=True) or {}
+    try:
+        grants = [(_['employee_id'], _['role']) for _ in payload['grants']]
+    except (KeyError, TypeError):
+        abort(400)
+    # the pairs are deduplicated and looked up in the role map
+    if not _hashable(grants):
+        abort(400)
+    results = EmployeeAppAccess.grant(grants)
+    return jsonify({
+        'granted': results['granted'],
+        'unmatched': [dict(zip(('employee_id', 'role'), _)) for _ in results['unmatched']]})
+
+@bp.route('/access/matrix')
+def access_matrix():
+    access = Employee.access_matrix()
+    if request.args.get('format') == 'csv':
+        return Response(matrix.iter_csv(access), mimetype='text/csv')
+    return Response(matrix.iter_json(access), mimetype='application/json')
+
+@bp.route('/sla/scan', methods=['POST'])
+def sla_scan():
+    return _enqueue('sla_scan', _sla_scan)
+
+@bp.route('/sla/breaches')
+def sla_breaches():
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify({'breaches': SlaScanner(db.graph, processes).breaches(limit)})
+
+@bp.route('/changes')
+def changes():
+    '''change events after an offset as newline delimited json, see outbox.py'''
+    after = request.args.get('after', 0, type=int)
+    limit = min(request.args.get('limit', 1000, type=int), 10000)
+    # hold the request open for new events for up to wait seconds
+    wait = min(request.args.get('wait', 0, type=float), 60)
+    events = outbox.follow(db.graph, after, limit, wait)
+    return Response(stream_with_context(outbox.iter_ndjson(events)), mimetype='application/x-ndjson')
+
+@bp.route('/jobs')
+def job_list():
+    return jsonify({'jobs': jobs.all()})
+
+@bp.route('/jobs/<job_id>')
+def job(job_id):
+    state = jobs.get(job_id)
+    if state is None:
+        abort(404)
+    if state['status'] == RUNNING:
+        state['duration'] = time.time() - state['started_at']
+    return jsonify(state)
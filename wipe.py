@@ -0,0 +1,64 @@
+class ChunkedWipe(object):
+    '''delete the whole graph in bounded chunks
+
+    relationships go first, then nodes label by label, each chunk in its
+    own transaction so memory stays bounded; every step only deletes what
+    is left, so an interrupted wipe resumes by simply running it again
+    '''
+
+    def __init__(self, graph, batch_size=10000, progress=None):
+        self.graph = graph
+        self.batch_size = batch_size
+        self.progress = progress
+        self.deleted = {'relationships': 0, 'nodes': 0}
+
+    def _report(self, stage, deleted):
+        if self.progress is not None:
+            self.progress(stage, deleted)
+
+    def _delete_in_chunks(self, statement, stage, kind):
+        '''delete chunk by chunk, reporting the running count of this stage'''
+        stage_deleted = 0
+        while True:
+            deleted = self.graph.run(statement, {'limit': self.batch_size}).evaluate()
+            if not deleted:
+                return stage_deleted
+            stage_deleted += deleted
+            self.deleted[kind] += deleted
+            self._report(stage, stage_deleted)
+
+    def labels(self):
+        return sorted(result['label'] for result in self.graph.run("CALL db.labels() YIELD label"))
+
+    def delete_relationships(self):
+        return self._delete_in_chunks((
+            "MATCH ()-[r]->() "
+            "WITH r LIMIT $limit "
+            "DELETE r "
+            "RETURN count(r)"
+        ), 'relationships', 'relationships')
+
+    def delete_nodes(self, label=None):
+        if label is None:
+            match = "MATCH (n) "
+        else:
+            match = "MATCH (n:`%s`) " % label.replace('`', '``')
+        return self._delete_in_chunks((
+            match +
+            "WITH n LIMIT $limit "
+            "DETACH DELETE n "
+            "RETURN count(n)"
+        ), label or 'nodes', 'nodes')
+
+    def run(self):
+        self.delete_relationships()
+        for label in self.labels():
+            self.delete_nodes(label)
+        # anything without a label
+        self.delete_nodes()
+        return self.deleted
+
+
+def wipe_graph(graph, batch_size=10000, progress=None):
+    '''delete every relationship and node, see ChunkedWipe'''
+    return ChunkedWipe(graph, batch_size, progress).run()
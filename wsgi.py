@@ -0,0 +1,8 @@
+'''the production entrypoint, see gunicorn_config.py'''
+from factory import create_app
+
+app = create_app()
+
+# compile every template in the master so forked workers share them
+for name in app.jinja_env.list_templates():
+    app.jinja_env.get_template(name)